@@ -0,0 +1,360 @@
+#! /usr/bin/python2.7
+"""Benchmarks of the release helpers, run on a generated tree shaped like the private repo.
+
+The tree has a unity-sample-app whose Assets/MoPub holds thousands of .cs files (a given share of
+their lines are // TODO comments) with .meta files, Android plugins and a ProjectSettings.asset
+of several megabytes, next to SDK checkouts shaped like submodules, with .aar and .jar files
+nested in them. The same parameters and seed always generate the same tree.
+
+Each benchmark runs the helper the release runs, on a fresh copy of the tree when the helper
+changes it, and is timed over several runs; the best run counts. Results are written as JSON,
+and compared against a baseline: a benchmark has regressed if its best run took THRESHOLD more
+than the baseline's, and at least MIN_DELTA seconds longer. Baselines only compare across trees
+generated with the same parameters. Set MOPUB_BENCHMARK_BASELINE to change where the baseline lives.
+
+    benchmark.py generate DIR [--cs-files N] [--todo-density F] [--settings-mb N] ...
+    benchmark.py run [--tree DIR] [--only NAME...] [--output FILE] [--save-baseline]
+"""
+import argparse, collections, hashlib, json, os, platform, random, re, shutil, sys, tempfile, time
+import file_helper, meta_index, os_helper, package_manifest, release, strip_lines, unity_yaml
+import unitypackage
+
+BASELINE = os.environ.get('MOPUB_BENCHMARK_BASELINE', os.path.join(
+    os.path.expanduser('~'), '.cache', 'mopub-unity', 'benchmark-baseline.json'))
+REPEAT = 3
+THRESHOLD = 0.2
+MIN_DELTA = 0.05
+RESULTS_VERSION = 1
+
+# Parameters of the generated tree
+TreeParameters = collections.namedtuple(
+    'TreeParameters', 'cs_files todo_density settings_mb submodules binaries binary_kb seed')
+DEFAULT_TREE = TreeParameters(cs_files=2000, todo_density=0.02, settings_mb=4, submodules=4,
+                              binaries=10, binary_kb=256, seed=0)
+# .cs files per folder of the generated Assets, and folders per level
+FILES_PER_FOLDER = 40
+FOLDERS_PER_LEVEL = 6
+CS_LINES = 60
+PROJECT = 'unity-sample-app'
+SETTINGS = os.path.join(PROJECT, 'ProjectSettings', 'ProjectSettings.asset')
+
+
+def generate_tree(root, params=DEFAULT_TREE):
+    """Writes a tree shaped like the private repo, as described by params, into root."""
+    rng = random.Random(params.seed)
+    assets = os.path.join(root, PROJECT, 'Assets')
+    _write_folder(rng, assets, 'MoPub')
+    _write_folder(rng, assets, 'PlayServicesResolver')
+    _write_file(rng, os.path.join(assets, 'PlayServicesResolver', 'Resolver.cs'), _cs_source(rng, 0))
+
+    # the scripts spread over nested folders, like Scripts/Internal/... in the real plugin
+    folders = ['MoPub/Scripts']
+    _write_folder(rng, assets, 'MoPub/Scripts')
+    for index in range(params.cs_files):
+        if index and index % FILES_PER_FOLDER == 0:
+            parent = folders[(len(folders) - 1) // FOLDERS_PER_LEVEL]
+            folders.append('{}/Folder{}'.format(parent, len(folders)))
+            _write_folder(rng, assets, folders[-1])
+        _write_file(rng, os.path.join(assets, folders[-1], 'Script{}.cs'.format(index)),
+                    _cs_source(rng, params.todo_density))
+
+    plugins = 'MoPub/Plugins/Android'
+    for folder in ('MoPub/Plugins', plugins):
+        _write_folder(rng, assets, folder)
+    for index in range(params.binaries):
+        name = ('mopub-sdk-{}.aar', 'unity-ads-{}.jar', 'mopub-sdk-native-{}.jar')[index % 3]
+        _write_file(rng, os.path.join(assets, plugins, name.format(index)),
+                    _random_bytes(rng, params.binary_kb * 1024))
+
+    _write_settings(rng, os.path.join(root, SETTINGS), params.settings_mb)
+    open(os.path.join(root, PROJECT, 'ProjectSettings', 'ProjectVersion.txt'), 'w').write(
+        'm_EditorVersion: 2018.4.0f1\n')
+
+    # SDK checkouts: a .git file like a submodule's, and libraries a few folders down
+    names = release.MOPUB_SDK_SUBMODULES + release.INTERNAL_MOPUB_SDK_SUBMODULES
+    for index in range(params.submodules):
+        name = names[index] if index < len(names) else 'mopub-sdk-{}'.format(index)
+        checkout = os.path.join(root, name)
+        _makedirs(checkout)
+        with open(os.path.join(checkout, '.git'), 'w') as outfile:
+            outfile.write('gitdir: ../.git/modules/{}\n'.format(name))
+        for depth in range(params.binaries):
+            libs = os.path.join(checkout, *['module{}'.format(level) for level in range(depth % 4)] + ['libs'])
+            _makedirs(libs)
+            library = ('mopub-{}.aar', 'vungle-{}.jar', 'dagger-{}.jar', 'okhttp-{}.jar')[depth % 4]
+            with open(os.path.join(libs, library.format(depth)), 'wb') as outfile:
+                outfile.write(_random_bytes(rng, params.binary_kb * 1024))
+    _makedirs(os.path.join(root, 'scripts', 'private'))
+    with open(os.path.join(root, 'scripts', 'private', 'release.py'), 'w') as outfile:
+        outfile.write('# private\n')
+
+def load_tree_parameters(root):
+    with open(os.path.join(root, 'benchmark-tree.json')) as infile:
+        return TreeParameters(**json.load(infile))
+
+def _write_folder(rng, assets, folder):
+    _makedirs(os.path.join(assets, folder))
+    with open(os.path.join(assets, folder + '.meta'), 'w') as outfile:
+        outfile.write(_meta(rng, 'folderAsset: yes\nDefaultImporter:\n  userData: \n'))
+
+def _write_file(rng, path, contents):
+    with open(path, 'wb') as outfile:
+        outfile.write(contents)
+    with open(path + '.meta', 'w') as outfile:
+        outfile.write(_meta(rng, 'MonoImporter:\n  serializedVersion: 2\n  userData: \n'))
+
+def _meta(rng, importer):
+    return 'fileFormatVersion: 2\nguid: {:032x}\n{}'.format(rng.getrandbits(128), importer)
+
+def _cs_source(rng, todo_density):
+    lines = ['using UnityEngine;', '', 'public class Generated{} : MonoBehaviour'.format(rng.getrandbits(32)), '{']
+    for index in range(CS_LINES):
+        if rng.random() < todo_density:
+            lines.append('    // TODO: ADF-{} revisit before the release'.format(rng.randint(1000, 9999)))
+        else:
+            lines.append('    private int field{} = {};'.format(index, rng.randint(0, 1 << 16)))
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+def _random_bytes(rng, size):
+    # incompressible, like the .aar and .jar archives they stand in for; hashing a counter is far
+    # quicker than drawing every byte from rng
+    seed = '{:032x}'.format(rng.getrandbits(128))
+    blocks = [hashlib.sha512(seed + str(index)).digest() for index in xrange(size // 64 + 1)]
+    return ''.join(blocks)[:size]
+
+def _write_settings(rng, path, size_mb):
+    _makedirs(os.path.dirname(path))
+    lines = ['%YAML 1.1', '%TAG !u! tag:unity3d.com,2011:', '--- !u!129 &1', 'PlayerSettings:',
+             '  m_ObjectHideFlags: 0', '  bundleVersion: 5.10.0', '  buildNumber:', '    iOS: 5100',
+             '  AndroidBundleVersionCode: 5100', '  appleDeveloperTeamID: 4S7XS533V3',
+             '  scriptingDefineSymbols:', '    1: mopub_developer;mopub_native_beta',
+             '    4: mopub_developer;mopub_native_beta', '    7: mopub_developer',
+             '  m_BuildTargetIcons:']
+    size = sum(len(line) + 1 for line in lines)
+    index = 0
+    while size < size_mb * 1024 * 1024:
+        item = ['  - m_BuildTarget: Target{}'.format(index), '    m_Icons:',
+                '    - serializedVersion: 2', '      m_Icon: {fileID: 0}',
+                '      m_Width: {}'.format(rng.choice([48, 72, 96, 144, 192])),
+                '      m_Height: {}'.format(rng.choice([48, 72, 96, 144, 192])),
+                '      m_Kind: {}'.format(index % 4)]
+        lines.extend(item)
+        size += sum(len(line) + 1 for line in item)
+        index += 1
+    lines.append('  AndroidMinSdkVersion: 16')
+    with open(path, 'w') as outfile:
+        outfile.write('\n'.join(lines) + '\n')
+
+def _makedirs(path):
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+
+# A benchmark's setup(tree, work) prepares what it needs under the scratch folder work, untimed,
+# and returns the call to time.
+BENCHMARKS = collections.OrderedDict()
+
+def benchmark(func):
+    BENCHMARKS[func.__name__] = func
+    return func
+
+def _fresh_copy(tree, work, name='tree'):
+    """Returns a copy of tree under work, brought back to match tree if an earlier run changed it."""
+    copy = os.path.join(work, name)
+    file_helper.sync_tree(tree, copy)
+    return copy
+
+@benchmark
+def strip_lines_tree(tree, work):
+    copy = _fresh_copy(tree, work)
+    return lambda: strip_lines.process_directory(copy)
+
+@benchmark
+def replace_file_lines(tree, work):
+    settings = os.path.join(_fresh_copy(tree, work), SETTINGS)
+    pattern = (re.compile(r'^(\s*bundleVersion:).*'), r'\1 5.11.0')
+    return lambda: release.replace_file_lines(settings, pattern)
+
+@benchmark
+def unity_yaml_version(tree, work):
+    settings = os.path.join(_fresh_copy(tree, work), SETTINGS)
+    def edit():
+        # what update_sample_app_version and make_build_scripts_use_public_sdks do to the file
+        project_settings = unity_yaml.UnityYaml(settings)
+        project_settings.set('PlayerSettings.bundleVersion', '5.11.0')
+        project_settings.set('PlayerSettings.buildNumber.iOS', '5110')
+        project_settings.set('PlayerSettings.AndroidBundleVersionCode', '5110')
+        defines = 'PlayerSettings.scriptingDefineSymbols'
+        for group in project_settings.keys(defines):
+            path = '{}.{}'.format(defines, group)
+            project_settings.set(path, release.clear_mopub_defines(project_settings.get(path)))
+        project_settings.save()
+    return edit
+
+@benchmark
+def remove_unreleased_code(tree, work):
+    copy = _fresh_copy(tree, work)
+    def remove():
+        cwd = os.getcwd()
+        os.chdir(copy)
+        try:
+            release.remove_unreleased_code()
+        finally:
+            os.chdir(cwd)
+    return remove
+
+@benchmark
+def export_package_cold(tree, work):
+    cache = os.path.join(work, 'package-cache')
+    if os.path.isdir(cache):
+        shutil.rmtree(cache)
+    return lambda: unitypackage.write_package(os.path.join(work, 'cold.unitypackage'),
+                                              os.path.join(tree, PROJECT), cache_dir=cache)
+
+@benchmark
+def export_package_warm(tree, work):
+    cache = os.path.join(work, 'package-cache-warm')
+    dest = os.path.join(work, 'warm.unitypackage')
+    if not os.path.isdir(cache):
+        unitypackage.write_package(dest, os.path.join(tree, PROJECT), cache_dir=cache)
+    return lambda: unitypackage.write_package(dest, os.path.join(tree, PROJECT), cache_dir=cache)
+
+@benchmark
+def package_manifest_stream(tree, work):
+    package = os.path.join(work, 'manifest.unitypackage')
+    if not os.path.isfile(package):
+        unitypackage.write_package(package, os.path.join(tree, PROJECT),
+                                   cache_dir=os.path.join(work, 'package-cache-manifest'))
+    return lambda: package_manifest.package_manifest(package)
+
+@benchmark
+def meta_index_cold(tree, work):
+    index = os.path.join(work, 'meta-index-cold.json')
+    if os.path.isfile(index):
+        os.remove(index)
+    return lambda: meta_index.check(os.path.join(tree, PROJECT), index_path=index)
+
+@benchmark
+def meta_index_warm(tree, work):
+    index = os.path.join(work, 'meta-index-warm.json')
+    if not os.path.isfile(index):
+        meta_index.check(os.path.join(tree, PROJECT), index_path=index)
+    return lambda: meta_index.check(os.path.join(tree, PROJECT), index_path=index)
+
+
+class _Discard(object):
+    """Stands in for sys.stdout while a benchmark runs, so the helpers' output doesn't drown the results."""
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+def run(tree, names=None, repeat=REPEAT):
+    """Runs the named benchmarks (all of them by default) on tree. Returns the results as a dict."""
+    results = collections.OrderedDict()
+    with os_helper.mktempdir() as work:
+        for name in names or BENCHMARKS:
+            runs = []
+            for _ in range(repeat):
+                stdout, sys.stdout = sys.stdout, _Discard()
+                try:
+                    timed = BENCHMARKS[name](tree, work)
+                    start = time.time()
+                    timed()
+                    runs.append(time.time() - start)
+                finally:
+                    sys.stdout = stdout
+            results[name] = {'best': min(runs), 'median': sorted(runs)[len(runs) // 2], 'runs': runs}
+            print '{:<28} {:>9.3f}s'.format(name, min(runs))
+    return {'version': RESULTS_VERSION, 'time': time.time(), 'host': platform.node(),
+            'python': platform.python_version(), 'tree': load_tree_parameters(tree)._asdict(),
+            'benchmarks': results}
+
+def compare(results, baseline, threshold=THRESHOLD, min_delta=MIN_DELTA):
+    """Yields (name, best, baseline best) for every benchmark slower than the baseline allows."""
+    for name, result in results['benchmarks'].items():
+        previous = baseline['benchmarks'].get(name)
+        if previous is None:
+            continue
+        if result['best'] > previous['best'] * (1 + threshold) and \
+                result['best'] - previous['best'] >= min_delta:
+            yield name, result['best'], previous['best']
+
+def write(results, path):
+    _makedirs(os.path.dirname(os.path.abspath(path)))
+    with open(path + '.tmp', 'w') as outfile:
+        json.dump(results, outfile, indent=1)
+    os.rename(path + '.tmp', path)
+
+def _generate(root, params):
+    generate_tree(root, params)
+    with open(os.path.join(root, 'benchmark-tree.json'), 'w') as outfile:
+        json.dump(params._asdict(), outfile, indent=1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the release helpers on a generated tree.')
+    subparsers = parser.add_subparsers(title="commands")
+    tree_parser = argparse.ArgumentParser(add_help=False)
+    for field in TreeParameters._fields:
+        default = getattr(DEFAULT_TREE, field)
+        tree_parser.add_argument('--' + field.replace('_', '-'), dest=field, type=type(default),
+                                 default=default, help='Defaults to {}.'.format(default))
+    generate_parser = subparsers.add_parser('generate', parents=[tree_parser],
+                                            help='Generate a tree to benchmark on')
+    generate_parser.add_argument('root')
+    generate_parser.set_defaults(command='generate')
+    run_parser = subparsers.add_parser('run', parents=[tree_parser],
+                                       help='Run the benchmarks and compare them against the baseline')
+    run_parser.add_argument('--tree', help='A generated tree; by default one is generated with the '
+                                           'tree options into a temp folder.')
+    run_parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), metavar='NAME',
+                            help='The benchmarks to run: {}.'.format(', '.join(BENCHMARKS)))
+    run_parser.add_argument('--repeat', type=int, default=REPEAT,
+                            help='Runs of each benchmark. Defaults to {}.'.format(REPEAT))
+    run_parser.add_argument('--output', help='Where to write the results.')
+    run_parser.add_argument('--baseline', default=BASELINE, help='Defaults to {}.'.format(BASELINE))
+    run_parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                            help='Allowed slowdown over the baseline. Defaults to {}.'.format(THRESHOLD))
+    run_parser.add_argument('--save-baseline', action='store_true',
+                            help='Make these results the baseline.')
+    run_parser.set_defaults(command='run')
+    args = parser.parse_args()
+    params = TreeParameters(**dict((field, getattr(args, field)) for field in TreeParameters._fields))
+
+    if args.command == 'generate':
+        _generate(args.root, params)
+        sys.exit(0)
+
+    tempdir = None
+    tree = args.tree
+    if tree is None:
+        tempdir = tempfile.mkdtemp()
+        tree = tempdir
+        start = time.time()
+        _generate(tree, params)
+        print 'Generated the tree in {:.1f}s'.format(time.time() - start)
+    try:
+        results = run(tree, args.only, args.repeat)
+    finally:
+        if tempdir is not None:
+            shutil.rmtree(tempdir)
+    if args.output:
+        write(results, args.output)
+    regressions = []
+    if os.path.isfile(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as infile:
+            baseline = json.load(infile)
+        if baseline['tree'] != results['tree']:
+            print 'The baseline was run on a different tree ({}), so nothing is compared'.format(
+                ', '.join('{}={}'.format(key, value) for key, value in sorted(baseline['tree'].items())))
+        else:
+            regressions = list(compare(results, baseline, args.threshold))
+            for name, best, previous in regressions:
+                print '\033[0;31mRegressed: {} took {:.3f}s, against {:.3f}s in the baseline\033[0m'.format(
+                    name, best, previous)
+    if args.save_baseline:
+        write(results, args.baseline)
+        print 'Saved the baseline to {}'.format(args.baseline)
+    sys.exit(1 if regressions else 0)
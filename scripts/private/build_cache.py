@@ -0,0 +1,120 @@
+"""A local, content-addressed cache of the Android AARs built by scripts/build-android.sh.
+
+The cache key covers everything that goes into the build: the Android SDK submodule's commit, the
+Unity wrapper sources and gradle files, and whether the internal or public SDK is used. On a hit
+the AARs are copied straight into the sample app, skipping gradle altogether.
+Set MOPUB_BUILD_CACHE to change where the cache lives.
+
+Layout under the cache directory:
+    objects/<sha1[:2]>/<sha1[2:]>   each AAR, stored once by the hash of its contents
+    entries/<key>.json              the destination path -> object hash of every AAR for a key
+"""
+import hashlib, json, os, shutil
+import git_helper, os_helper
+
+CACHE_DIR = os.environ.get('MOPUB_BUILD_CACHE',
+                           os.path.join(os.path.expanduser('~'), '.cache', 'mopub-unity', 'build'))
+BUILD_SCRIPT = os.path.join('scripts', 'build-android.sh')
+WRAPPER_DIR = 'mopub-android-sdk-unity'
+# Wrapper inputs, relative to WRAPPER_DIR: directories are hashed recursively.
+WRAPPER_INPUTS = ['src', 'libs', 'build.gradle', 'settings.gradle', 'gradle.properties',
+                  'proguard.txt', 'project.properties', 'gradle/wrapper/gradle-wrapper.properties']
+UNITY_ANDROID_DIR = 'unity-sample-app/Assets/MoPub/Plugins/Android'
+SDK_LIBS = ['base', 'banner', 'interstitial', 'rewardedvideo', 'native-static']
+OUTPUTS = [os.path.join(UNITY_ANDROID_DIR, 'mopub-unity-wrappers.aar')] + \
+          [os.path.join(UNITY_ANDROID_DIR, 'mopub-sdk-{}.aar'.format(lib)) for lib in SDK_LIBS]
+
+
+def internal_sdk():
+    """Whether build-android.sh will use the internal SDK; mirrors its INTERNAL_SDK default."""
+    if 'INTERNAL_SDK' in os.environ:
+        return os.environ['INTERNAL_SDK'] == 'true'
+    if not os.path.isdir('mopub-android') or not os.path.isfile('.gitmodules'):
+        return False
+    with open('.gitmodules') as infile:
+        return 'submodule "mopub-android"' in infile.read()
+
+def key(internal=None):
+    """Returns the cache key for building from the current directory, or None if it can't be cached.
+
+    Builds from an SDK submodule with local changes are never cached.
+    """
+    if internal is None:
+        internal = internal_sdk()
+    sdk_dir = 'mopub-android' if internal else 'mopub-android-sdk'
+    if not os.path.isdir(sdk_dir):
+        return None
+    if os_helper.check_output('git -C {} status --porcelain'.format(sdk_dir)).strip():
+        return None
+    digest = hashlib.sha1()
+    digest.update('internal={}\n'.format(internal))
+    digest.update('sdk={}\n'.format(git_helper.Repo(sdk_dir).current_hash()))
+    for path in [BUILD_SCRIPT] + list(_files(WRAPPER_DIR, WRAPPER_INPUTS)):
+        digest.update('{}\n{}\n'.format(path, _hash_file(path)))
+    return digest.hexdigest()
+
+def restore(cache_key, cache_dir=CACHE_DIR):
+    """Copies the cached AARs for cache_key into place. Returns False on a cache miss."""
+    entry = _entry_path(cache_dir, cache_key)
+    if cache_key is None or not os.path.isfile(entry):
+        return False
+    with open(entry) as infile:
+        outputs = json.load(infile)
+    objects = dict((dest, _object_path(cache_dir, sha)) for dest, sha in outputs.items())
+    if not all(os.path.isfile(obj) for obj in objects.values()):
+        return False
+    for dest, obj in sorted(objects.items()):
+        _copy(obj, dest)
+    return True
+
+def store(cache_key, cache_dir=CACHE_DIR):
+    """Adds the freshly built AARs to the cache under cache_key."""
+    if cache_key is None:
+        return
+    outputs = {}
+    for dest in OUTPUTS:
+        sha = _hash_file(dest)
+        obj = _object_path(cache_dir, sha)
+        if not os.path.isfile(obj):
+            _copy(dest, obj)
+        outputs[dest] = sha
+    entry = _entry_path(cache_dir, cache_key)
+    _makedirs(os.path.dirname(entry))
+    with open(entry + '.tmp', 'w') as outfile:
+        json.dump(outputs, outfile, indent=2, sort_keys=True)
+    os.rename(entry + '.tmp', entry)
+
+
+def _files(root, inputs):
+    """Yields every file among root/inputs, in a stable order."""
+    for name in inputs:
+        path = os.path.join(root, name)
+        if os.path.isfile(path):
+            yield path
+        for (dirpath, dirnames, filenames) in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                yield os.path.join(dirpath, filename)
+
+def _hash_file(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(1 << 20), ''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _object_path(cache_dir, sha):
+    return os.path.join(cache_dir, 'objects', sha[:2], sha[2:])
+
+def _entry_path(cache_dir, cache_key):
+    return os.path.join(cache_dir, 'entries', '{}.json'.format(cache_key))
+
+def _makedirs(path):
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+def _copy(src, dest):
+    """Copies src to dest through a temp file, so dest is never left half written."""
+    _makedirs(os.path.dirname(dest))
+    shutil.copyfile(src, dest + '.tmp')
+    os.rename(dest + '.tmp', dest)
@@ -0,0 +1,85 @@
+"""Checkpoints for release steps, so that a failed release run can be resumed."""
+import hashlib, json, os, subprocess
+import git_helper
+
+
+class Checkpoints(object):
+    """Records each top-level release step of a run in a small JSON state file.
+
+    A checkpoint holds the step name, a hash of its inputs (its arguments, the directory it ran in
+    and the commit left by the previous step), the commit it left behind and its return value.
+    When resuming, steps are skipped for as long as they line up with the recorded checkpoints and
+    their commits still exist; from the first step that doesn't, everything runs again and the
+    state file is rewritten from there on.
+    """
+    def __init__(self, path, run_id, resume=False):
+        self.path = path
+        self.run_id = run_id
+        self.previous = []
+        if resume and os.path.isfile(path):
+            with open(path) as infile:
+                state = json.load(infile)
+            if state.get('run') == run_id:
+                self.previous = state['steps']
+        self.steps = []
+        self.resuming = bool(self.previous)
+        self.depth = 0
+
+    def run(self, name, args, kwargs, step):
+        """Calls step() unless it can be skipped.
+
+        Returns (skipped, result), where result is the recorded return value for skipped steps.
+        """
+        if self.depth:
+            # steps called from inside other steps are covered by the outer step's checkpoint
+            return False, step()
+
+        cwd = os.getcwd()
+        last_commit = self.steps[-1]['commit'] if self.steps else None
+        inputs = hashlib.sha1(json.dumps([name, args, kwargs, cwd, last_commit],
+                                         sort_keys=True, default=repr)).hexdigest()
+        index = len(self.steps)
+        if self.resuming and index < len(self.previous):
+            recorded = self.previous[index]
+            if recorded['name'] == name and recorded['inputs'] == inputs and \
+                    _commit_exists(recorded['commit']):
+                self.steps.append(recorded)
+                return True, recorded['result']
+        self.resuming = False
+
+        self.depth += 1
+        try:
+            result = step()
+        finally:
+            self.depth -= 1
+        self.steps.append({'name': name, 'inputs': inputs, 'cwd': cwd, 'result': result,
+                           'commit': _current_commit()})
+        self.save()
+        return False, result
+
+    def save(self):
+        tmpname = self.path + '.tmp'
+        with open(tmpname, 'w') as outfile:
+            json.dump({'run': self.run_id, 'steps': self.steps}, outfile, indent=2, default=repr)
+        os.rename(tmpname, self.path)
+
+    def clear(self):
+        """Removes the state file, once the run has completed."""
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+
+
+def _current_commit():
+    try:
+        return git_helper.current_hash()
+    except subprocess.CalledProcessError:
+        return None
+
+def _commit_exists(commit):
+    if commit is None:
+        return True
+    try:
+        git_helper.session().resolve(commit + '^{commit}')
+        return True
+    except subprocess.CalledProcessError:
+        return False
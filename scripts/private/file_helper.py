@@ -0,0 +1,252 @@
+"""Batched, atomic line edits for text files, and syncing or pruning directory trees."""
+import collections, ctypes, ctypes.util, errno, filecmp, multiprocessing.pool, os, re, shutil, stat
+import subprocess, sys, tempfile
+
+
+class FileEdits(object):
+    """Queues line replacement patterns per file, then applies them with one pass over each file.
+
+    Replacement patterns are formatted (compiled_regex, replacement), as for release.replace_file_lines.
+    Every queued pattern must be used, or apply() raises a single CalledProcessError listing every
+    unused pattern in every file, and no file is modified.
+    Patterns for the same file are tried in the order they were queued, and earlier ones
+    short-circuit later ones on the same line.
+
+    Can be used as a context manager, applying the edits when the block exits without an exception:
+        with FileEdits() as edits:
+            edits.replace(fname, (pattern, replacement))
+    """
+    def __init__(self):
+        self.edits = collections.OrderedDict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.apply()
+
+    def replace(self, fname, *patterns):
+        """Queues the given (compiled_regex, replacement) patterns for fname."""
+        self.edits.setdefault(fname, []).extend(patterns)
+        return self
+
+    def apply(self):
+        """Rewrites every file with its queued patterns, renaming each into place atomically."""
+        staged = []
+        unmatched = []
+        try:
+            for fname, patterns in self.edits.items():
+                tmpname, used = _rewrite(fname, patterns)
+                staged.append((tmpname, fname))
+                unmatched.extend((fname, pattern) for pattern, matched in zip(patterns, used)
+                                 if not matched)
+            if unmatched:
+                error_output = "Didn't find all provided patterns:"
+                for fname, pattern in unmatched:
+                    error_output += "\n\tfile: {} pattern: {} replacement: {}".format(
+                        fname, pattern[0].pattern, pattern[1])
+                raise subprocess.CalledProcessError(1, cmd="FileEdits.apply", output=error_output)
+            for tmpname, fname in staged:
+                os.rename(tmpname, fname)
+            staged = []
+        finally:
+            for tmpname, _fname in staged:
+                os.remove(tmpname)
+        self.edits.clear()
+
+
+def _rewrite(fname, patterns):
+    """Writes fname with the patterns applied to a temp file beside it, keeping its mode bits.
+
+    Returns (temp file name, list of whether each pattern was used).
+    """
+    used = [False] * len(patterns)
+    outfile = tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(fname)),
+                                          prefix=os.path.basename(fname) + '.', delete=False)
+    try:
+        with open(fname, 'r') as infile, outfile:
+            for line in infile:
+                for i, pattern in enumerate(patterns):
+                    # This will raise an IndexError if the patterns are not structured properly
+                    regex, replacement = pattern[0], pattern[1]
+                    (outline, replaced) = regex.subn(replacement, line)
+                    if replaced > 0:
+                        used[i] = True
+                        line = outline
+                        break
+                outfile.write(line)
+        shutil.copymode(fname, outfile.name)
+    except:
+        os.remove(outfile.name)
+        raise
+    return outfile.name, used
+
+
+def sync_tree(src, dest, exclude=('.git',), link=False, exclude_nested=()):
+    """Makes dest a copy of src, like `rsync -aWL --delete src/ dest`, writing only what changed.
+
+    Top-level names in exclude are neither copied nor deleted, and names in exclude_nested aren't
+    at any depth (like the .git files of submodules, which point into different repos on either
+    side). Symlinks are followed. A file is unchanged if its size and mtime match, or failing that
+    its contents; unchanged files only get their mode and mtime brought over. Changed files are
+    written to a temp file that is renamed into place: as a copy-on-write clone where the
+    filesystem supports it (APFS, btrfs, XFS), and as a plain copy otherwise.
+
+    With link, changed files are hardlinked to the source instead. That is the cheapest option, but
+    anything later writing into a file in place (rather than replacing it) changes both trees.
+    Without it, files still hardlinked to the source are replaced by copies.
+
+    Returns a dict counting the 'unchanged', 'linked', 'cloned', 'copied' and 'deleted' paths.
+    """
+    counts = dict.fromkeys(['unchanged', 'linked', 'cloned', 'copied', 'deleted'], 0)
+    _sync_dir(src, dest, set(exclude) | set(exclude_nested), set(exclude_nested), link, counts)
+    return counts
+
+def _sync_dir(src, dest, exclude, exclude_nested, link, counts):
+    if os.path.islink(dest) or not os.path.isdir(dest):
+        if os.path.lexists(dest):
+            os.remove(dest)
+        os.mkdir(dest)
+    names = set(os.listdir(src)) - exclude
+    for name in sorted(set(os.listdir(dest)) - exclude - names):
+        _remove(os.path.join(dest, name))
+        counts['deleted'] += 1
+    for name in sorted(names):
+        src_path, dest_path = os.path.join(src, name), os.path.join(dest, name)
+        if os.path.isdir(src_path):
+            _sync_dir(src_path, dest_path, exclude_nested, exclude_nested, link, counts)
+        elif os.path.exists(src_path):
+            _sync_file(src_path, dest_path, link, counts)
+    shutil.copystat(src, dest)
+
+def _sync_file(src, dest, link, counts):
+    src_stat = os.stat(src)
+    if os.path.isfile(dest) and not os.path.islink(dest):
+        dest_stat = os.stat(dest)
+        linked = (src_stat.st_dev, src_stat.st_ino) == (dest_stat.st_dev, dest_stat.st_ino)
+        if linked and link:
+            counts['unchanged'] += 1
+            return
+        if not linked and src_stat.st_size == dest_stat.st_size and \
+                (int(src_stat.st_mtime) == int(dest_stat.st_mtime) or
+                 filecmp.cmp(src, dest, shallow=False)):
+            if stat.S_IMODE(src_stat.st_mode) != stat.S_IMODE(dest_stat.st_mode) or \
+                    src_stat.st_mtime != dest_stat.st_mtime:
+                shutil.copystat(src, dest)
+            counts['unchanged'] += 1
+            return
+    elif os.path.lexists(dest):
+        _remove(dest)
+
+    tmpname = dest + '.sync-tmp'
+    if link:
+        try:
+            os.link(os.path.realpath(src), tmpname)
+            os.rename(tmpname, dest)
+            counts['linked'] += 1
+            return
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+    if _clone(os.path.realpath(src), tmpname):
+        shutil.copystat(src, tmpname)
+        counts['cloned'] += 1
+    else:
+        shutil.copy2(src, tmpname)
+        counts['copied'] += 1
+    os.rename(tmpname, dest)
+
+# From linux/fs.h: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+def _clone(src, dest):
+    """Creates dest as a copy-on-write clone of src. Returns False if the filesystem can't."""
+    try:
+        if sys.platform == 'darwin':
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            return libc.clonefile(src, dest, 0) == 0
+        if sys.platform.startswith('linux'):
+            import fcntl
+            with open(src, 'rb') as infile, open(dest, 'wb') as outfile:
+                fcntl.ioctl(outfile.fileno(), FICLONE, infile.fileno())
+            return True
+    except (AttributeError, IOError, OSError):
+        if os.path.lexists(dest):
+            os.remove(dest)
+    return False
+
+class GlobSet(object):
+    """Include and exclude glob patterns, each compiled into a single regex.
+
+    A pattern without a slash matches a file or directory name anywhere in the tree, like
+    `find -name`. One with a slash matches a path relative to the root, like .gitignore.
+    '*' and '?' never match a slash, and '**' matches anything including slashes.
+    """
+    def __init__(self, include, exclude=()):
+        self.include = _compile_globs(include)
+        # an excluded directory excludes everything under it too
+        self.exclude = _compile_globs(exclude, '(?:/.*)?')
+
+    def matches(self, relpath):
+        return bool(self.include.match(relpath)) and not self.excludes(relpath)
+
+    def excludes(self, relpath):
+        return bool(self.exclude.match(relpath))
+
+def _compile_globs(patterns, suffix=''):
+    regexes = []
+    for pattern in patterns:
+        regex = _translate_glob(pattern.strip('/'))
+        regexes.append(regex if '/' in pattern.strip('/') else '(?:.*/)?' + regex)
+    # an empty set matches nothing
+    return re.compile('(?:{}){}\\Z'.format('|'.join(regexes) or '(?!)', suffix))
+
+def _translate_glob(pattern):
+    parts = re.split(r'(\*\*|\*|\?)', pattern)
+    wildcards = {'**': '.*', '*': '[^/]*', '?': '[^/]'}
+    return ''.join(wildcards.get(part, re.escape(part)) for part in parts)
+
+def find_matches(root, globs):
+    """Walks root once and returns the sorted root-relative paths that globs matches.
+
+    A matched directory is returned whole and not descended into, and neither is an excluded one.
+    Symlinks are never followed.
+    """
+    matches = []
+    for (dirpath, dirnames, filenames) in os.walk(root):
+        relative = os.path.relpath(dirpath, root).replace(os.sep, '/')
+        prefix = '' if relative == '.' else relative + '/'
+        descend = []
+        for name in dirnames:
+            relpath = prefix + name
+            if globs.excludes(relpath):
+                continue
+            if globs.include.match(relpath):
+                matches.append(relpath)
+            elif not os.path.islink(os.path.join(dirpath, name)):
+                descend.append(name)
+        dirnames[:] = descend
+        matches.extend(prefix + name for name in filenames if globs.matches(prefix + name))
+    return sorted(matches)
+
+def prune_tree(root, globs, dry_run=False, workers=8):
+    """Deletes everything under root that globs matches, using a pool of threads.
+
+    Returns the sorted root-relative paths deleted, or with dry_run, the ones that would be.
+    """
+    matches = find_matches(root, globs)
+    if matches and not dry_run:
+        pool = multiprocessing.pool.ThreadPool(min(workers, len(matches)))
+        try:
+            pool.map(_remove, [os.path.join(root, relpath) for relpath in matches])
+        finally:
+            pool.close()
+            pool.join()
+    return matches
+
+def _remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
@@ -1,38 +1,327 @@
 #!/usr/bin/python
-import os
+import atexit, os, re, subprocess, threading
 import os_helper
 
 
+class Repo(object):
+    """A session on the git repository containing a directory.
+
+    HEAD, refs and the origin url are read straight from the .git directory; anything else is
+    resolved by one long-lived `git cat-file --batch-check` process. Branch and hash lookups are
+    cached until a git_helper command changes them, or the files they were read from change.
+
+    Without search_parents, path must be the top of the work tree itself: an uninitialized
+    submodule (an empty directory) raises, rather than resolving to its superproject.
+    """
+    def __init__(self, path='.', search_parents=True):
+        self.work_tree = os.path.abspath(path)
+        while not os.path.exists(os.path.join(self.work_tree, '.git')):
+            parent = os.path.dirname(self.work_tree)
+            if parent == self.work_tree or not search_parents:
+                raise subprocess.CalledProcessError(128, cmd="git_helper.Repo",
+                                                    output="Not a git repository: " + path)
+            self.work_tree = parent
+        self.git_dir = os.path.join(self.work_tree, '.git')
+        if os.path.isfile(self.git_dir):
+            # submodules and worktrees have a .git file pointing at the real git dir
+            self.git_dir = os.path.join(self.work_tree, _read(self.git_dir)[len('gitdir: '):])
+        self.git_dir = os.path.normpath(self.git_dir)
+        self.common_dir = self.git_dir
+        if os.path.isfile(os.path.join(self.git_dir, 'commondir')):
+            self.common_dir = os.path.normpath(os.path.join(
+                self.git_dir, _read(os.path.join(self.git_dir, 'commondir'))))
+        self._cache = {}
+        self._batch = None
+        self._batch_lock = threading.Lock()
+
+    def invalidate(self):
+        """Forgets every cached lookup; called after commands that move HEAD or refs."""
+        self._cache.clear()
+
+    def close(self):
+        if self._batch is not None:
+            self._batch.stdin.close()
+            self._batch.wait()
+            self._batch = None
+
+    def current_branch(self):
+        """Returns the checked out branch name, or 'HEAD' if detached (like rev-parse --abbrev-ref)."""
+        head = self._head()
+        if head.startswith('ref: refs/heads/'):
+            return head[len('ref: refs/heads/'):]
+        if head.startswith('ref: '):
+            return head[len('ref: '):]
+        return 'HEAD'
+
+    def current_hash(self):
+        return self.resolve('HEAD')
+
+    def resolve(self, name):
+        """Returns the commit hash for HEAD, a full ref name, or any other revision."""
+        if name == 'HEAD':
+            head = self._head()
+            if not head.startswith('ref: '):
+                return head
+            name = head[len('ref: '):]
+        if name.startswith('refs/'):
+            loose = os.path.join(self.common_dir, name)
+            packed = os.path.join(self.common_dir, 'packed-refs')
+            sha = self._cached(name, (loose, packed), lambda: self._read_ref(name))
+            if sha:
+                return sha
+        return self._batch_check(name)
+
+    def worktrees(self):
+        """Returns {branch: path} for every worktree with a branch checked out, the main one included.
+
+        Read from the worktrees folder of the common git dir, like `git worktree list`, leaving out
+        worktrees whose folder is gone.
+        """
+        admin = os.path.join(self.common_dir, 'worktrees')
+        entries = [os.path.join(admin, name) for name in sorted(_listdir(admin))]
+        paths = [admin, os.path.join(self.common_dir, 'HEAD')] + \
+            [os.path.join(entry, name) for entry in entries for name in ('HEAD', 'gitdir')]
+        branches = self._cached('worktrees', paths, lambda: self._read_worktrees(entries))
+        return dict((branch, path) for branch, path in branches.items() if os.path.isdir(path))
+
+    def remote_url(self, remote='origin'):
+        config = os.path.join(self.common_dir, 'config')
+        url = self._cached('remote.' + remote, (config,), lambda: self._read_remote_url(remote))
+        if url is None:
+            url = os_helper.check_output('git -C {} config --get remote.{}.url'.format(
+                self.work_tree, remote)).strip()
+        return url
+
+    def _head(self):
+        head_path = os.path.join(self.git_dir, 'HEAD')
+        return self._cached('HEAD', (head_path,), lambda: _read(head_path))
+
+    def _cached(self, key, paths, load):
+        """Returns load(), reusing the last value as long as the given files are unchanged."""
+        stamp = tuple(_stamp(path) for path in paths)
+        entry = self._cache.get(key)
+        if entry is None or entry[0] != stamp:
+            entry = (stamp, load())
+            self._cache[key] = entry
+        return entry[1]
+
+    def _read_ref(self, ref):
+        loose = os.path.join(self.common_dir, ref)
+        if os.path.isfile(loose):
+            value = _read(loose)
+            if value.startswith('ref: '):
+                return self.resolve(value[len('ref: '):])
+            return value
+        packed = os.path.join(self.common_dir, 'packed-refs')
+        if os.path.isfile(packed):
+            with open(packed) as infile:
+                for line in infile:
+                    if line.startswith(('#', '^')):
+                        continue
+                    sha, _sep, name = line.strip().partition(' ')
+                    if name == ref:
+                        return sha
+        return None
+
+    def _read_worktrees(self, entries):
+        branches = {}
+        if os.path.basename(self.common_dir) == '.git':
+            main = os.path.dirname(self.common_dir)
+        elif self.git_dir == self.common_dir:
+            main = self.work_tree
+        else:
+            main = None
+        worktrees = [(main, self.common_dir)] if main is not None else []
+        for entry in entries:
+            gitdir = os.path.join(entry, 'gitdir')
+            if os.path.isfile(gitdir) and os.path.isfile(os.path.join(entry, 'HEAD')):
+                # gitdir holds the path of the worktree's .git file
+                path = os.path.dirname(os.path.normpath(os.path.join(entry, _read(gitdir))))
+                worktrees.append((path, entry))
+        for path, git_dir in worktrees:
+            head = _read(os.path.join(git_dir, 'HEAD'))
+            if head.startswith('ref: refs/heads/'):
+                branches.setdefault(head[len('ref: refs/heads/'):], path)
+        return branches
+
+    def _read_remote_url(self, remote):
+        section = None
+        with open(os.path.join(self.common_dir, 'config')) as infile:
+            for line in infile:
+                line = line.strip()
+                header = re.match(r'\[\s*(\S+)(?:\s+"(.*)")?\s*\]$', line)
+                if header:
+                    section = header.groups()
+                elif section == ('remote', remote):
+                    key, _sep, value = line.partition('=')
+                    if key.strip() == 'url':
+                        return value.strip()
+        return None
+
+    def _batch_check(self, name):
+        with self._batch_lock:
+            if self._batch is None:
+                self._batch = subprocess.Popen(['git', 'cat-file', '--batch-check'],
+                                               cwd=self.work_tree, stdin=subprocess.PIPE,
+                                               stdout=subprocess.PIPE, env=os.environ)
+            self._batch.stdin.write(name + '\n')
+            self._batch.stdin.flush()
+            fields = self._batch.stdout.readline().split()
+        if len(fields) != 3:
+            raise subprocess.CalledProcessError(128, cmd="git cat-file --batch-check",
+                                                output="Unknown revision: " + name)
+        return fields[0]
+
+
+def _read(path):
+    with open(path) as infile:
+        return infile.read().strip()
+
+def _listdir(path):
+    try:
+        return os.listdir(path)
+    except OSError:
+        return []
+
+def _stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime)
+
+
+_sessions = {}
+
+def session():
+    """Returns the Repo for the current working directory, creating it on first use."""
+    cwd = os.getcwd()
+    if cwd not in _sessions:
+        _sessions[cwd] = Repo(cwd)
+    return _sessions[cwd]
+
+def _invalidate():
+    for repo in _sessions.values():
+        repo.invalidate()
+
+@atexit.register
+def _close_sessions():
+    for repo in _sessions.values():
+        repo.close()
+
+
 def current_branch():
-    return os_helper.check_output('git rev-parse --abbrev-ref HEAD').strip()
+    return session().current_branch()
 
 def current_hash():
-    return os_helper.check_output('git rev-parse HEAD').strip()
+    return session().current_hash()
 
 def repo_name():
-    return os_helper.check_output('git config --get remote.origin.url').strip()
+    return session().remote_url('origin')
 
 def create(branch):
-    return os_helper.check_output('git branch {}'.format(branch)).strip()
+    output = os_helper.check_output('git branch {}'.format(branch)).strip()
+    _invalidate()
+    return output
 
 def checkout(branch):
     if branch != current_branch():
         print 'Checking out branch: ' + branch
         os_helper.call('git checkout ' + branch)
+        _invalidate()
 
 def pull():
     print 'Pulling branch: ' + current_branch()
     os_helper.call('git pull')
+    _invalidate()
 
 
 def merge(branch):
     print 'Merging branch: {} into {}'.format(branch, current_branch())
     os_helper.call('git merge {} --no-edit'.format(branch))
+    _invalidate()
+
+
+# Where worktree() adds worktrees, under the repository's common git dir
+WORKTREE_DIR = 'release-worktrees'
+
+def worktrees():
+    """Returns {branch: path} for every worktree with a branch checked out, the main one included."""
+    return session().worktrees()
+
+def worktree(branch):
+    """Returns the path of a worktree with branch checked out, adding one if there is none.
+
+    The branch is never checked out in the current worktree, so its files, and anything cached
+    from them (like Unity's Library), are left alone.
+    """
+    path = worktrees().get(branch)
+    if path is not None:
+        return path
+    path = os.path.join(session().common_dir, WORKTREE_DIR, branch)
+    # forgets worktrees whose folder was deleted, which would hold on to their branch
+    os_helper.check_call('git worktree prune')
+    print 'Adding a worktree for branch {}: {}'.format(branch, path)
+    os_helper.check_call('git worktree add --quiet {} {}'.format(path, branch))
+    _invalidate()
+    return path
+
+def is_added_worktree(path):
+    """Returns whether the worktree at path is one that worktree() added."""
+    # git lists worktrees by their real path, which differs if the checkout is reached by a symlink
+    root = os.path.realpath(os.path.join(session().common_dir, WORKTREE_DIR))
+    return os.path.realpath(path).startswith(root + os.sep)
+
+def remove_worktree(branch):
+    """Removes the worktree of branch, if worktree() added it, so the branch can be deleted."""
+    path = worktrees().get(branch)
+    if path is not None and is_added_worktree(path):
+        print 'Removing the worktree of branch {}: {}'.format(branch, path)
+        os_helper.check_call('git worktree remove --force {}'.format(path))
+        _invalidate()
+
+def remove_worktrees():
+    """Removes every worktree that worktree() added."""
+    for branch in worktrees():
+        remove_worktree(branch)
+    os_helper.check_call('git worktree prune')
+
+def cherry_pick(commit, branch):
+    """Cherry picks commit onto branch without checking branch out here.
+
+    If branch is checked out in a worktree, the commit is picked there. Otherwise it is picked in
+    a temporary detached worktree, and branch is moved to the result.
+    """
+    path = worktrees().get(branch)
+    if path is not None:
+        os_helper.check_call('git -C {} cherry-pick -x --allow-empty {}'.format(path, commit))
+    else:
+        old = session().resolve('refs/heads/' + branch)
+        with os_helper.mktempdir() as tempdir:
+            path = os.path.join(tempdir, branch)
+            os_helper.check_call('git worktree add --quiet --detach {} {}'.format(path, old))
+            try:
+                os_helper.check_call('git -C {} cherry-pick -x --allow-empty {}'.format(path, commit))
+                new = Repo(path).current_hash()
+            finally:
+                os_helper.check_call('git worktree remove --force {}'.format(path))
+        # fails if the branch moved meanwhile, rather than losing what moved it
+        os_helper.check_call('git update-ref refs/heads/{} {} {}'.format(branch, new, old))
+    _invalidate()
+
+def pull_branch(branch):
+    """Brings branch up to date with origin without checking it out here."""
+    path = worktrees().get(branch)
+    print 'Pulling branch: ' + branch
+    if path is not None:
+        os_helper.call('git -C {} pull'.format(path))
+    else:
+        # only fast-forwards, like a pull without local commits
+        os_helper.call('git fetch origin {0}:{0}'.format(branch))
+    _invalidate()
 
 
 def chdir_root():
-    # git_root is the .git directory, so change to one directory higher
-    git_dir = os_helper.check_output('git rev-parse --git-dir')
-    git_root = os.path.abspath(os.path.join(git_dir.strip(), '..'))
+    git_root = session().work_tree
     print 'Changing working directory to git root: {}'.format(git_root)
     os.chdir(git_root)
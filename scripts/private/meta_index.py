@@ -0,0 +1,183 @@
+#! /usr/bin/python2.7
+"""Checks that every exported asset has a .meta file with a GUID of its own.
+
+Unity regenerates missing .meta files and drops assets with clashing GUIDs without complaint, which
+breaks references to them in publishers' projects once the package is imported. This finds:
+    missing metas      assets without a .meta file
+    orphaned metas     .meta files whose asset is gone
+    duplicate GUIDs    two .meta files with the same GUID
+    invalid metas      .meta files without a GUID
+
+The GUID of every .meta file is kept in an index in the project's Library folder (which Unity owns
+and git ignores), along with the listing of every folder. Later runs only list the folders and
+read the .meta files whose mtime or size changed, so a check of an unchanged tree takes a few
+milliseconds.
+"""
+import argparse, collections, json, os, sys, time
+import unitypackage
+
+INDEX_NAME = os.path.join('Library', 'mopub-meta-index.json')
+ROOTS = [unitypackage.EXPORT_PARENT] + unitypackage.EXPORT_EXTRA_FOLDERS
+# Roots that must exist; the extra folders are only exported when they do
+REQUIRED_ROOTS = [unitypackage.EXPORT_PARENT]
+INDEX_VERSION = 1
+# Files changed within this many seconds of the index being written could have the same mtime
+# as when they were indexed (HFS+ only keeps whole seconds), so they are always read again.
+RACY_WINDOW = 2
+
+
+class Report(object):
+    def __init__(self):
+        self.missing_roots = []
+        self.empty_roots = []
+        self.missing = []
+        self.orphaned = []
+        self.invalid = []
+        self.guids = {}
+        self.duplicates = collections.defaultdict(list)
+        self.listed = 0
+        self.read = 0
+
+    def problems(self):
+        """Returns a line describing each problem found, or an empty list."""
+        lines = ['Missing folder: {}'.format(path) for path in self.missing_roots]
+        lines += ['Empty folder: {}'.format(path) for path in self.empty_roots]
+        lines += ['Missing .meta: {}'.format(path) for path in self.missing]
+        lines += ['Orphaned .meta: {}'.format(path) for path in self.orphaned]
+        lines += ['No GUID in: {}'.format(path) for path in self.invalid]
+        lines += ['Duplicate GUID {}: {}'.format(guid, ', '.join(paths))
+                  for guid, paths in sorted(self.duplicates.items())]
+        return lines
+
+
+def check(project_path=unitypackage.PROJECT_PATH, roots=ROOTS, index_path=None,
+          required_roots=REQUIRED_ROOTS):
+    """Checks the assets under the project-relative roots, and updates the index. Returns a Report.
+
+    A missing project, or a missing or empty root among required_roots, is a problem too.
+    """
+    report = Report()
+    if not os.path.isdir(project_path):
+        report.missing_roots.append(project_path)
+        return report
+    if index_path is None:
+        index_path = os.path.join(project_path, INDEX_NAME)
+    previous = _load(index_path)
+    racy = previous['written'] - RACY_WINDOW
+    index = {'version': INDEX_VERSION, 'written': time.time(), 'dirs': {}, 'metas': {}}
+
+    def cached(kind, path, stat):
+        entry = previous[kind].get(path)
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime and \
+                stat.st_mtime < racy:
+            return entry
+        return None
+
+    pending = []
+    for root in roots:
+        if not os.path.isdir(os.path.join(project_path, root)):
+            if root in required_roots:
+                report.missing_roots.append(root)
+            continue
+        if root in required_roots and not any(_list(project_path, root, index, previous, cached, report)):
+            report.empty_roots.append(root)
+        # the root folders are assets too, so their .meta files live in the folder above
+        parent = os.path.dirname(root)
+        pending.append(root)
+        _check_names(report, index, parent, [os.path.basename(root)],
+                     [name for name in _list(project_path, parent, index, previous, cached, report)[1]
+                      if name == os.path.basename(root) + '.meta'])
+    while pending:
+        folder = pending.pop()
+        dirnames, filenames = _list(project_path, folder, index, previous, cached, report)
+        _check_names(report, index, folder, dirnames, filenames)
+        pending.extend(folder + '/' + name for name in dirnames)
+
+    for meta in sorted(index['metas']):
+        stat = os.stat(os.path.join(project_path, meta))
+        entry = cached('metas', meta, stat)
+        if entry is None:
+            entry = [stat.st_size, stat.st_mtime, _read_guid(os.path.join(project_path, meta))]
+            report.read += 1
+        index['metas'][meta] = entry
+        guid = entry[2]
+        if guid is None:
+            report.invalid.append(meta)
+        elif guid in report.guids:
+            report.duplicates[guid].append(meta[:-len('.meta')])
+        else:
+            report.guids[guid] = meta[:-len('.meta')]
+    for guid, paths in report.duplicates.items():
+        paths.insert(0, report.guids[guid])
+
+    _save(index_path, index)
+    return report
+
+
+def _list(project_path, folder, index, previous, cached, report):
+    """Returns the asset (dirnames, filenames) of folder, reusing the last listing if it's unchanged."""
+    if folder in index['dirs']:
+        return index['dirs'][folder][2:]
+    path = os.path.join(project_path, folder)
+    stat = os.stat(path)
+    entry = cached('dirs', folder, stat)
+    if entry is None:
+        dirnames, filenames = [], []
+        for name in sorted(os.listdir(path)):
+            if unitypackage.is_asset(name):
+                (dirnames if os.path.isdir(os.path.join(path, name)) else filenames).append(name)
+        # a folder's size tells nothing, but keeps the entries shaped like those of files
+        entry = [stat.st_size, stat.st_mtime, dirnames, filenames]
+        report.listed += 1
+    index['dirs'][folder] = entry
+    return entry[2:]
+
+def _check_names(report, index, folder, dirnames, filenames):
+    names = set(dirnames) | set(filenames)
+    prefix = folder + '/' if folder else ''
+    for name in sorted(names):
+        if name.endswith('.meta'):
+            if name[:-len('.meta')] in names:
+                index['metas'][prefix + name] = None
+            else:
+                report.orphaned.append(prefix + name)
+        elif name + '.meta' not in names:
+            report.missing.append(prefix + name)
+
+def _read_guid(meta):
+    try:
+        return unitypackage.read_guid(meta)
+    except ValueError:
+        return None
+
+def _load(index_path):
+    empty = {'version': INDEX_VERSION, 'written': 0, 'dirs': {}, 'metas': {}}
+    if not os.path.isfile(index_path):
+        return empty
+    try:
+        with open(index_path) as infile:
+            index = json.load(infile)
+    except ValueError:
+        return empty
+    return index if index.get('version') == INDEX_VERSION else empty
+
+def _save(index_path, index):
+    directory = os.path.dirname(index_path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(index_path + '.tmp', 'w') as outfile:
+        json.dump(index, outfile, separators=(',', ':'), sort_keys=True)
+    os.rename(index_path + '.tmp', index_path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the sample app's .meta files and GUIDs.")
+    parser.add_argument('--project', default=unitypackage.PROJECT_PATH,
+                        help='The Unity project to check. Defaults to {}.'.format(unitypackage.PROJECT_PATH))
+    args = parser.parse_args()
+    start = time.time()
+    report = check(args.project)
+    for line in report.problems():
+        print line
+    print '{} metas checked in {:.1f}ms ({} folders listed, {} metas read)'.format(
+        len(report.guids), (time.time() - start) * 1000, report.listed, report.read)
+    sys.exit(1 if report.problems() else 0)
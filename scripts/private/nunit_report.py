@@ -0,0 +1,207 @@
+#! /usr/bin/python2.7
+"""Summarizes the Unity editor test results written by scripts/run_unit_tests.sh.
+
+The result file is read incrementally, dropping each test case once it has been counted, so memory
+stays flat however large the suite gets. Both the NUnit 3 format written by Unity 2017 and later
+(<test-run>) and the older NUnit 2 one (<test-results>) are understood.
+
+Each run's per-test durations are appended to a SQLite history, and tests that got markedly slower
+than their average over the previous runs are flagged. Set MOPUB_TEST_HISTORY to change where the
+history lives.
+"""
+import argparse, collections, heapq, os, sqlite3, sys, time
+import xml.etree.cElementTree as ElementTree
+
+TEST_RESULTS = os.path.join('scripts', 'testresults.xml')
+HISTORY_PATH = os.environ.get('MOPUB_TEST_HISTORY', os.path.join(
+    os.path.expanduser('~'), '.cache', 'mopub-unity', 'test-history.sqlite'))
+SLOWEST = 10
+# A test has regressed if it took RATIO times its average over the last RUNS passing runs,
+# and at least MIN_DELTA seconds longer; the latter keeps millisecond tests from being noisy.
+RUNS = 5
+RATIO = 1.5
+MIN_DELTA = 0.1
+
+# NUnit 3 result and label attributes, and NUnit 2 result attributes, by outcome
+OUTCOMES = {'Passed': 'passed', 'Success': 'passed',
+            'Failed': 'failed', 'Failure': 'failed', 'Error': 'failed', 'Cancelled': 'failed',
+            'Skipped': 'skipped', 'Ignored': 'skipped', 'Inconclusive': 'skipped',
+            'NotRunnable': 'skipped'}
+
+# name: the test's full name; fixture: the class or suite that holds it
+# outcome: 'passed', 'failed' or 'skipped'; duration: in seconds; message: the failure message
+TestCase = collections.namedtuple('TestCase', 'name fixture outcome duration message')
+
+
+class Report(object):
+    """Totals, slowest tests and per-fixture durations of a test run, built one test at a time."""
+    def __init__(self, slowest=SLOWEST):
+        self.counts = collections.OrderedDict((outcome, 0) for outcome in ('passed', 'failed', 'skipped'))
+        self.fixtures = collections.defaultdict(float)
+        self.failures = []
+        self.regressions = []
+        self.duration = 0.0
+        self._slowest = []
+        self._slowest_size = slowest
+
+    def add(self, test):
+        self.counts[test.outcome] += 1
+        self.fixtures[test.fixture] += test.duration
+        self.duration += test.duration
+        if test.outcome == 'failed':
+            self.failures.append(test)
+        if self._slowest_size:
+            entry = (test.duration, test.name)
+            if len(self._slowest) < self._slowest_size:
+                heapq.heappush(self._slowest, entry)
+            elif entry > self._slowest[0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def slowest(self):
+        """Returns (duration, name) of the slowest tests, slowest first."""
+        return sorted(self._slowest, reverse=True)
+
+    def format(self):
+        lines = ['{} tests in {:.3f}s: {}'.format(
+            self.total, self.duration, ', '.join('{} {}'.format(count, outcome)
+                                                 for outcome, count in self.counts.items()))]
+        if self._slowest:
+            lines.append('Slowest tests:')
+            lines.extend('  {:>9.3f}s  {}'.format(duration, name) for duration, name in self.slowest())
+        if self.fixtures:
+            lines.append('Fixtures:')
+            lines.extend('  {:>9.3f}s  {}'.format(duration, fixture) for fixture, duration in
+                         sorted(self.fixtures.items(), key=lambda item: -item[1]))
+        if self.regressions:
+            lines.append('Slower than the average of the last {} runs:'.format(RUNS))
+            lines.extend('  {:>9.3f}s  (was {:.3f}s)  {}'.format(duration, average, name)
+                         for name, duration, average in self.regressions)
+        for test in self.failures:
+            lines.append('FAILED: {}'.format(test.name))
+            if test.message:
+                lines.extend('    ' + line for line in test.message.strip().splitlines())
+        return '\n'.join(lines)
+
+
+def iter_test_cases(path):
+    """Yields a TestCase for every test case in the result file at path, as it is read."""
+    fixtures = []
+    parents = []
+    for event, element in ElementTree.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            if element.tag == 'test-suite':
+                suite_type = element.get('type')
+                fixtures.append(element.get('fullname') or element.get('name')
+                                if suite_type in ('TestFixture', 'ParameterizedFixture') or
+                                suite_type is None else None)
+            parents.append(element)
+            continue
+
+        parents.pop()
+        if element.tag == 'test-suite':
+            fixtures.pop()
+        elif element.tag == 'test-case':
+            yield _test_case(element, next((f for f in reversed(fixtures) if f), ''))
+            # drop the finished test case, so the tree never grows past the current one
+            if parents:
+                parents[-1].remove(element)
+            element.clear()
+
+def _test_case(element, fixture):
+    name = element.get('fullname') or element.get('name')
+    result = element.get('result')
+    if element.get('executed') == 'False':
+        outcome = 'skipped'
+    else:
+        outcome = OUTCOMES.get(element.get('label'), OUTCOMES.get(result, 'failed'))
+    duration = float(element.get('duration') or element.get('time') or 0)
+    message = element.findtext('failure/message') if outcome == 'failed' else None
+    if element.get('classname'):
+        fixture = element.get('classname')
+    return TestCase(name, fixture, outcome, duration, message)
+
+
+class History(object):
+    """Per-test durations of earlier runs, in a SQLite database."""
+    def __init__(self, path=HISTORY_PATH):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.db = sqlite3.connect(path)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, started REAL,
+                                             passed INTEGER, failed INTEGER, skipped INTEGER,
+                                             duration REAL);
+            CREATE TABLE IF NOT EXISTS results (run INTEGER, name TEXT, fixture TEXT, outcome TEXT,
+                                                duration REAL);
+            CREATE INDEX IF NOT EXISTS results_by_name ON results (name, run);
+        ''')
+
+    def start_run(self):
+        return self.db.execute('INSERT INTO runs (started) VALUES (?)', (time.time(),)).lastrowid
+
+    def add(self, run, test):
+        self.db.execute('INSERT INTO results VALUES (?, ?, ?, ?, ?)',
+                        (run, test.name, test.fixture, test.outcome, test.duration))
+
+    def finish_run(self, run, report):
+        self.db.execute('UPDATE runs SET passed = ?, failed = ?, skipped = ?, duration = ? WHERE id = ?',
+                        (report.counts['passed'], report.counts['failed'], report.counts['skipped'],
+                         report.duration, run))
+        self.db.commit()
+
+    def regressions(self, run, runs=RUNS, ratio=RATIO, min_delta=MIN_DELTA):
+        """Returns (name, duration, average) of the passing tests of run that got slower."""
+        return self.db.execute('''
+            SELECT current.name, current.duration, AVG(previous.duration) AS average
+            FROM results AS current JOIN results AS previous
+                ON previous.name = current.name AND previous.outcome = 'passed'
+                AND previous.run IN (SELECT id FROM runs WHERE id < :run ORDER BY id DESC LIMIT :runs)
+            WHERE current.run = :run AND current.outcome = 'passed'
+            GROUP BY current.name, current.duration
+            HAVING current.duration > average * :ratio AND current.duration - average > :min_delta
+            ORDER BY current.duration - average DESC
+        ''', {'run': run, 'runs': runs, 'ratio': ratio, 'min_delta': min_delta}).fetchall()
+
+    def close(self):
+        self.db.close()
+
+
+def analyze(path=TEST_RESULTS, history_path=HISTORY_PATH, slowest=SLOWEST):
+    """Returns the Report for the result file at path, recording it in the history unless
+    history_path is None.
+    """
+    report = Report(slowest)
+    history = History(history_path) if history_path is not None else None
+    try:
+        run = history.start_run() if history else None
+        for test in iter_test_cases(path):
+            report.add(test)
+            if history:
+                history.add(run, test)
+        if history:
+            history.finish_run(run, report)
+            report.regressions = history.regressions(run)
+    finally:
+        if history:
+            history.close()
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Summarize Unity editor test results.')
+    parser.add_argument('results', nargs='?', default=TEST_RESULTS,
+                        help='The NUnit result file. Defaults to {}.'.format(TEST_RESULTS))
+    parser.add_argument('--history', default=HISTORY_PATH,
+                        help='The SQLite test history. Defaults to {}.'.format(HISTORY_PATH))
+    parser.add_argument('--no-history', action='store_true',
+                        help="Don't record this run or look for slower tests.")
+    parser.add_argument('--slowest', type=int, default=SLOWEST,
+                        help='How many of the slowest tests to list. Defaults to {}.'.format(SLOWEST))
+    args = parser.parse_args()
+    report = analyze(args.results, None if args.no_history else args.history, slowest=args.slowest)
+    print report.format()
+    sys.exit(1 if report.counts['failed'] or not report.total else 0)
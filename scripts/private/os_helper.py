@@ -1,24 +1,199 @@
-"""A set of utilities for manipulating directories & making system calls."""
-import os, shlex, subprocess, sys, tempfile
-import os_helper
+"""A set of utilities for manipulating directories & making system calls.
 
+Commands run through run(), which streams their output line by line, optionally behind a prefix
+so that concurrent commands can be told apart. A command string may be a pipeline of commands
+separated by a spaced-out '|', e.g. 'git ls-remote --heads origin | grep release', whose stages
+are connected directly rather than through a shell. At most MAX_COMMANDS commands (set with
+MOPUB_MAX_COMMANDS) run at once, across every thread; run_all() runs a batch of them concurrently.
+"""
+import collections, os, shlex, subprocess, sys, tempfile, threading, time, Queue
+import os_helper, profiler
 
+MAX_COMMANDS = int(os.environ.get('MOPUB_MAX_COMMANDS', 4))
+# How long to wait for a killed command's output to close before giving up on the rest of it
+KILL_GRACE = 5
 
-def check_output(command):
-    return subprocess.check_output(shlex.split(command), env=os.environ)
+_slots = threading.BoundedSemaphore(MAX_COMMANDS)
 
-def call(command):
-    return_code = subprocess.call(shlex.split(command), env=os.environ)
-    if return_code:
-        sys.exit(1)
+# stages: the argument list of every command in the pipeline
+# returncodes: the return code of every stage; negative for one killed by a signal
+# returncode: the first nonzero one of returncodes, or 0
+# output: the captured stdout of the last stage, or None if it wasn't captured
+# duration: wall time in seconds, not counting the wait for a free slot
+Result = collections.namedtuple('Result', 'stages returncodes returncode output duration timed_out')
 
-def check_call(command):
-    return subprocess.check_call(shlex.split(command), env=os.environ)
+
+def check_output(command, timeout=None):
+    return run(command, capture=True, timeout=timeout).output
+
+def call(command, timeout=None):
+    """Runs command, raising a CalledProcessError if it fails.
+
+    Same as check_call, but returns nothing.
+    """
+    run(command, timeout=timeout)
+
+def check_call(command, timeout=None):
+    run(command, timeout=timeout)
+    return 0
+
+def run(command, prefix=None, timeout=None, capture=False, check=True):
+    """Runs command, or a pipeline of commands, and returns its Result.
+
+    Output is written to sys.stdout as it arrives, with prefix in front of each line if given.
+    With capture, the last stage's stdout is collected into Result.output instead of being written.
+    A command still running after timeout seconds is killed.
+    With check, a CalledProcessError is raised if any stage fails or the command times out.
+    """
+    stages = split_pipeline(command)
+    with _slots:
+        result = _run(stages, prefix, timeout, capture)
+    if check and (result.returncode or result.timed_out):
+        output = result.output
+        if result.timed_out:
+            output = '{}Timed out after {}s'.format(output or '', timeout)
+        raise subprocess.CalledProcessError(result.returncode or 1, command, output=output)
+    return result
+
+def run_all(commands, **kwargs):
+    """Runs the commands concurrently, as far as MAX_COMMANDS allows; returns their Results in order.
+
+    kwargs are passed on to run(), except that each command's output is prefixed with its index
+    unless prefix is given. With check (the default), the first failure is raised once every
+    command has finished.
+    """
+    results = [None] * len(commands)
+    failures = [None] * len(commands)
+    lock = threading.Lock()
+
+    def run_one(index, command):
+        options = dict(kwargs)
+        options.setdefault('prefix', '[{}] '.format(index))
+        try:
+            results[index] = run(command, **options)
+        except BaseException:
+            failures[index] = sys.exc_info()
+
+    threads = [threading.Thread(target=run_one, args=(index, command))
+               for index, command in enumerate(commands)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        # join with a timeout so KeyboardInterrupt still gets through
+        while thread.is_alive():
+            thread.join(1)
+    for exc_info in failures:
+        if exc_info is not None:
+            raise exc_info[0], exc_info[1], exc_info[2]
+    return results
+
+def split_pipeline(command):
+    """Splits a command string into the argument lists of its pipeline stages."""
+    stages = [[]]
+    for arg in shlex.split(command):
+        if arg == '|':
+            stages.append([])
+        else:
+            stages[-1].append(arg)
+    if not all(stages):
+        raise ValueError('Empty command in pipeline: {!r}'.format(command))
+    return stages
+
+def _run(stages, prefix, timeout, capture):
+    """Starts the pipeline, streams its output from this thread, and waits for every stage.
+
+    Each pipe is read by its own thread, which hands the lines to this one, so that the output
+    ends up wherever sys.stdout points in the calling thread (see scheduler.Scheduler).
+    Waits with os.wait4 so each command's own CPU time and peak RSS can be recorded.
+    """
+    start = time.time()
+    processes = []
+    lines = Queue.Queue()
+    readers = []
+    try:
+        for index, args in enumerate(stages):
+            merge_stderr = index == len(stages) - 1 and not capture
+            processes.append(subprocess.Popen(
+                args, env=os.environ, stdin=processes[-1].stdout if processes else None,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT if merge_stderr else subprocess.PIPE))
+            if len(processes) > 1:
+                # the next stage holds the only reading end now, so the writer sees it close
+                processes[-2].stdout.close()
+            if not merge_stderr:
+                readers.append(_reader(processes[-1].stderr, 'err', lines))
+        readers.append(_reader(processes[-1].stdout, 'out', lines))
+    except OSError:
+        _kill(processes)
+        raise
+
+    deadline = start + timeout if timeout is not None else None
+    timed_out = False
+    chunks = []
+    open_pipes = len(readers)
+    while open_pipes:
+        wait = None if deadline is None else max(0, deadline - time.time())
+        try:
+            # Queue.get without a timeout can't be interrupted with Ctrl-C in Python 2
+            stream, line = lines.get(timeout=1 if wait is None else min(wait, 1))
+        except Queue.Empty:
+            if deadline is not None and time.time() >= deadline:
+                if timed_out:
+                    break
+                timed_out = True
+                _kill(processes)
+                deadline = time.time() + KILL_GRACE
+            continue
+        if line is None:
+            open_pipes -= 1
+        elif capture and stream == 'out':
+            chunks.append(line)
+        else:
+            sys.stdout.write(line if prefix is None else prefix + line)
+
+    returncodes = []
+    for args, process in zip(stages, processes):
+        _pid, status, usage = os.wait4(process.pid, 0)
+        process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        profiler.command(args, start, usage)
+        returncodes.append(process.returncode)
+    return Result(stages, returncodes, next((code for code in returncodes if code), 0),
+                  ''.join(chunks) if capture else None, time.time() - start, timed_out)
+
+def _reader(pipe, stream, lines):
+    """Starts a thread putting (stream, line) on lines for each line of pipe, then (stream, None)."""
+    def read():
+        try:
+            for line in iter(pipe.readline, ''):
+                lines.put((stream, line))
+        finally:
+            pipe.close()
+            lines.put((stream, None))
+    thread = threading.Thread(target=read)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+def _kill(processes):
+    for process in processes:
+        try:
+            process.kill()
+        except OSError:
+            # already exited
+            pass
 
 class mktempdir:
-    """Returns a tempdir class that can be deleted in a with block."""
+    """Returns a tempdir class that can be deleted in a with block.
+
+    Pass dir to create it somewhere other than the system temp directory, e.g. on the same
+    filesystem as files that will be renamed into it.
+    """
+    def __init__(self, dir=None):
+        self.dir = dir
+
     def __enter__(self):
-        self.direc = tempfile.mkdtemp()
+        self.direc = tempfile.mkdtemp(dir=self.dir)
         return self.direc
 
     def __exit__(self, type, value, traceback):
@@ -0,0 +1,164 @@
+#! /usr/bin/python2.7
+"""Content manifests of MoPubUnity.unitypackage, and the differences between two of them.
+
+A manifest lists every asset as {guid, path, size, sha1, meta_sha1}, sorted by GUID: size and sha1
+are those of the asset itself (None for folders) and meta_sha1 that of its .meta file. It can be
+built from a package, read as a stream without extracting anything to disk, or from the sample
+app's files, hashed by a process pool. commit_public_release writes one next to the package, so
+comparing against a release only takes its manifest.
+
+    package_manifest.py write [PACKAGE_OR_PROJECT] [--output MANIFEST]
+    package_manifest.py diff OLD NEW    (each a package, a project directory or a manifest)
+"""
+import argparse, gzip, hashlib, json, mmap, multiprocessing, os, sys, tarfile
+import unitypackage
+
+MANIFEST = os.path.splitext(unitypackage.DEST_PACKAGE)[0] + '.manifest.json'
+# Files at least this big are hashed through a memory map rather than read in blocks
+MMAP_THRESHOLD = 1 << 20
+BLOCK_SIZE = 1 << 20
+
+
+def tree_manifest(project_path=unitypackage.PROJECT_PATH, assets=None, processes=None):
+    """Returns the manifest of the assets unitypackage.py would export from project_path."""
+    if assets is None:
+        assets = unitypackage.collect_assets(project_path)
+    pool = multiprocessing.Pool(processes)
+    try:
+        return list(pool.imap(_hash_asset, [(project_path, guid, pathname)
+                                            for guid, pathname in assets], chunksize=8))
+    finally:
+        pool.close()
+        pool.join()
+
+def package_manifest(package=unitypackage.DEST_PACKAGE):
+    """Returns the manifest of a .unitypackage, reading it as a single stream."""
+    entries = {}
+    # GzipFile reads every gzip member in turn, which tarfile's own stream mode doesn't
+    with open(package, 'rb') as infile:
+        tar = tarfile.open(fileobj=gzip.GzipFile(fileobj=infile, mode='rb'), mode='r|')
+        for member in tar:
+            guid, _, name = member.name.lstrip('./').partition('/')
+            if not member.isfile() or name not in ('asset', 'asset.meta', 'pathname'):
+                continue
+            entry = entries.setdefault(guid, {'guid': guid, 'path': None, 'size': None,
+                                              'sha1': None, 'meta_sha1': None})
+            stream = tar.extractfile(member)
+            if name == 'pathname':
+                # Unity writes a second line with a hash of the path in some versions
+                entry['path'] = stream.read().splitlines()[0].strip()
+            elif name == 'asset':
+                entry['size'] = member.size
+                entry['sha1'] = _hash_stream(stream)
+            else:
+                entry['meta_sha1'] = _hash_stream(stream)
+        tar.close()
+    return [entries[guid] for guid in sorted(entries)]
+
+def load(source):
+    """Returns the manifest of a package, a Unity project directory, or a manifest file."""
+    if os.path.isdir(source):
+        return tree_manifest(source)
+    if source.endswith('.unitypackage'):
+        return package_manifest(source)
+    with open(source) as infile:
+        return json.load(infile)
+
+def write(manifest, dest=MANIFEST):
+    """Writes manifest as JSON with one asset per line, so it reads well in a git diff."""
+    with open(dest + '.tmp', 'w') as outfile:
+        outfile.write('[\n')
+        outfile.write(',\n'.join(json.dumps(entry, sort_keys=True) for entry in manifest))
+        outfile.write('\n]\n')
+    os.rename(dest + '.tmp', dest)
+
+def diff(old, new):
+    """Yields (change, old entry, new entry) for every asset that differs, in GUID order.
+
+    change is 'added', 'removed', 'moved' (a new path for the same GUID), 'changed' (new contents)
+    or 'moved+changed'. Both manifests are walked side by side, since both are sorted by GUID.
+    """
+    old, new = iter(old), iter(new)
+    old_entry, new_entry = next(old, None), next(new, None)
+    while old_entry is not None or new_entry is not None:
+        if new_entry is None or (old_entry is not None and old_entry['guid'] < new_entry['guid']):
+            yield 'removed', old_entry, None
+            old_entry = next(old, None)
+        elif old_entry is None or new_entry['guid'] < old_entry['guid']:
+            yield 'added', None, new_entry
+            new_entry = next(new, None)
+        else:
+            changes = []
+            if old_entry['path'] != new_entry['path']:
+                changes.append('moved')
+            if any(old_entry[key] != new_entry[key] for key in ('size', 'sha1', 'meta_sha1')):
+                changes.append('changed')
+            if changes:
+                yield '+'.join(changes), old_entry, new_entry
+            old_entry, new_entry = next(old, None), next(new, None)
+
+def format_change(change, old, new):
+    if change == 'added':
+        return 'A  {}'.format(new['path'])
+    if change == 'removed':
+        return 'D  {}'.format(old['path'])
+    details = []
+    if 'changed' in change:
+        details = [name for name, key in (('asset', 'sha1'), ('meta', 'meta_sha1'))
+                   if old[key] != new[key]]
+    path = new['path'] if old['path'] == new['path'] else '{} -> {}'.format(old['path'], new['path'])
+    return '{}  {}{}'.format('R' if 'moved' in change else 'M', path,
+                             ' ({})'.format(', '.join(details)) if details else '')
+
+
+def _hash_asset(args):
+    project_path, guid, pathname = args
+    path = os.path.join(project_path, pathname)
+    entry = {'guid': guid, 'path': pathname, 'size': None, 'sha1': None,
+             'meta_sha1': _hash_file(path + '.meta')}
+    if not os.path.isdir(path):
+        entry['size'] = os.path.getsize(path)
+        entry['sha1'] = _hash_file(path)
+    return entry
+
+def _hash_file(path):
+    with open(path, 'rb') as infile:
+        if os.fstat(infile.fileno()).st_size < MMAP_THRESHOLD:
+            return _hash_stream(infile)
+        mapped = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return hashlib.sha1(mapped).hexdigest()
+        finally:
+            mapped.close()
+
+def _hash_stream(stream):
+    digest = hashlib.sha1()
+    for block in iter(lambda: stream.read(BLOCK_SIZE), ''):
+        digest.update(block)
+    return digest.hexdigest()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Write or compare MoPubUnity.unitypackage manifests.')
+    subparsers = parser.add_subparsers(title="commands")
+    write_parser = subparsers.add_parser('write', help='Write the manifest of a package or project')
+    write_parser.add_argument('source', nargs='?', default=unitypackage.DEST_PACKAGE,
+                              help='Defaults to {}.'.format(unitypackage.DEST_PACKAGE))
+    write_parser.add_argument('--output', default=MANIFEST,
+                              help='Defaults to {}.'.format(MANIFEST))
+    write_parser.set_defaults(command='write')
+    diff_parser = subparsers.add_parser('diff', help='List the assets that differ between two sources')
+    diff_parser.add_argument('old')
+    diff_parser.add_argument('new')
+    diff_parser.set_defaults(command='diff')
+    args = parser.parse_args()
+
+    if args.command == 'write':
+        manifest = load(args.source)
+        write(manifest, args.output)
+        print 'Wrote the manifest of {} assets to {}'.format(len(manifest), args.output)
+    else:
+        changes = 0
+        for change in diff(load(args.old), load(args.new)):
+            print format_change(*change)
+            changes += 1
+        sys.exit(1 if changes else 0)
@@ -0,0 +1,93 @@
+"""Timing and resource usage of release steps and the commands they run."""
+import contextlib, json, os, resource, sys, threading, time
+
+# ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+RSS_TO_MB = 1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0
+
+
+class Trace(object):
+    """Collects timed spans and writes them as a Chrome trace (chrome://tracing, Perfetto)."""
+    def __init__(self):
+        self.start = time.time()
+        self.events = []
+        self.lock = threading.Lock()
+
+    def add(self, name, category, start, wall, **metrics):
+        with self.lock:
+            self.events.append({'name': name, 'cat': category, 'ph': 'X', 'pid': os.getpid(),
+                                'tid': threading.current_thread().ident,
+                                'ts': int((start - self.start) * 1e6), 'dur': int(wall * 1e6),
+                                'args': dict(metrics, wall=round(wall, 3))})
+
+    def write(self, path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(path, 'w') as outfile:
+            json.dump({'traceEvents': sorted(self.events, key=lambda e: e['ts']),
+                       'displayTimeUnit': 'ms'}, outfile, indent=1)
+
+    def summary(self, category=None, baseline=None):
+        """Returns a table of the spans totalled by name, slowest first.
+
+        If baseline is the path of an earlier trace, the change in total wall time from the spans
+        of the same name there is shown too.
+        """
+        totals = _totals(e for e in self.events if category is None or e['cat'] == category)
+        previous = {}
+        if baseline is not None:
+            with open(baseline) as infile:
+                previous = _totals(e for e in json.load(infile)['traceEvents']
+                                   if category is None or e['cat'] == category)
+        columns = ('calls', 'wall', 'cpu', 'children', 'peak_rss_mb')
+        row = '{:<44} {:>5} {:>9} {:>9} {:>9} {:>12} {:>9}'
+        lines = [row.format('step', *(columns + ('vs_last',)))]
+        for name, total in sorted(totals.items(), key=lambda item: -item[1]['wall']):
+            change = ''
+            if name in previous:
+                change = '{:+.3f}'.format(total['wall'] - previous[name]['wall'])
+            lines.append(row.format(name[:44], *([total[column] for column in columns] + [change])))
+        return '\n'.join(lines)
+
+
+def _totals(events):
+    """Sums the metrics of events by name; peak RSS is the maximum rather than the sum."""
+    totals = {}
+    for event in events:
+        total = totals.setdefault(event['name'], {'calls': 0, 'wall': 0, 'cpu': 0, 'children': 0,
+                                                  'peak_rss_mb': 0})
+        total['calls'] += 1
+        for column in ('wall', 'cpu', 'children'):
+            total[column] = round(total[column] + event['args'].get(column, 0), 3)
+        total['peak_rss_mb'] = max(total['peak_rss_mb'], event['args'].get('peak_rss_mb', 0))
+    return totals
+
+
+trace = Trace()
+
+def _peak_rss_mb(who):
+    return round(resource.getrusage(who).ru_maxrss / RSS_TO_MB, 1)
+
+@contextlib.contextmanager
+def step(name):
+    """Records wall, CPU and child-process time and peak RSS of the enclosed block.
+
+    CPU and child times are process-wide, so they include anything running concurrently.
+    """
+    start = time.time()
+    before = os.times()
+    try:
+        yield
+    finally:
+        after = os.times()
+        trace.add(name, 'step', start, time.time() - start,
+                  cpu=max(0.0, round(after[0] + after[1] - before[0] - before[1], 3)),
+                  children=max(0.0, round(after[2] + after[3] - before[2] - before[3], 3)),
+                  peak_rss_mb=max(_peak_rss_mb(resource.RUSAGE_SELF),
+                                  _peak_rss_mb(resource.RUSAGE_CHILDREN)))
+
+def command(args, start, usage):
+    """Records a finished subprocess, given the rusage returned by os.wait4."""
+    trace.add(' '.join(args), 'command', start, time.time() - start,
+              children=round(usage.ru_utime + usage.ru_stime, 3),
+              peak_rss_mb=round(usage.ru_maxrss / RSS_TO_MB, 1))
@@ -18,8 +18,9 @@ For more information, see the Unity Release document:
   http://go/adf-unity-release
 """
 import argparse
-import os, re, subprocess
-import git_helper, os_helper, strip_lines
+import contextlib, os, re, shutil, subprocess, time
+import build_cache, checkpoint, file_helper, git_helper, meta_index, nunit_report, os_helper
+import package_manifest, profiler, sample_apps, scheduler, strip_lines, submodule_mirror, unity_runner, unity_yaml, unitypackage
 
 GREEN = "\033[92m"
 RED   = "\033[91m"
@@ -27,14 +28,21 @@ END   = "\033[0m"
 WORKSPACE = os.path.abspath('../')
 PRIVATE_REPO = os.path.join(WORKSPACE, 'mopub-unity')
 PUBLIC_REPO = os.path.join(WORKSPACE, 'mopub-unity-sdk')
-ANDROID_BUILD_SCRIPT = os.path.join(PRIVATE_REPO, 'scripts', 'mopub-android-sdk-unity-build.sh')
-IOS_BUILD_SCRIPT = os.path.join(PRIVATE_REPO, 'scripts', 'mopub-ios-sdk-unity-build.sh')
-SAMPLE_APP_PROJECT_SETTINGS = os.path.join(PRIVATE_REPO, 'unity-sample-app', 'ProjectSettings',
-        'ProjectSettings.asset')
-NATIVE_JAR = os.path.join(PRIVATE_REPO, 'unity-sample-app', 'Assets', 'MoPub', 'Plugins', 'Android', 'MoPub', 'libs', 'mopub-sdk-native-static.jar')
+# Relative to the worktree of the branch being worked on, which on_branch steps run in
+ANDROID_BUILD_SCRIPT = os.path.join('scripts', 'mopub-android-sdk-unity-build.sh')
+IOS_BUILD_SCRIPT = os.path.join('scripts', 'mopub-ios-sdk-unity-build.sh')
+SAMPLE_APP_PROJECT_SETTINGS = os.path.join('unity-sample-app', 'ProjectSettings', 'ProjectSettings.asset')
+SAMPLE_APP_LIBRARY = os.path.join('unity-sample-app', 'Library')
+MOPUB_SDK_SUBMODULES = ['mopub-android-sdk', 'mopub-ios-sdk']
+INTERNAL_MOPUB_SDK_SUBMODULES = ['mopub-android', 'mopub-ios']
+UNRELEASED_FILE_PATTERNS = ['*.aar*', 'unity*.jar', 'chartboost*.jar', 'dagger*.jar', 'javax.inject*.jar',
+                            'vungle*.jar', 'scripts/private']
+# Never pruned: the SDK submodules are reset to their released commits separately
+UNRELEASED_EXCLUDED_PATTERNS = ['.git', 'mopub-android-sdk', 'mopub-ios-sdk']
+NATIVE_JAR = os.path.join('unity-sample-app', 'Assets', 'MoPub', 'Plugins', 'Android', 'MoPub', 'libs', 'mopub-sdk-native-static.jar')
 
 def on_branch(func):
-    """This decorator tries to check out a branch named for the first arg.
+    """This decorator runs the step in the worktree of the branch named for the first arg.
 
     Raises a CalledProcessError if it can't.
     """
@@ -42,14 +50,90 @@ def on_branch(func):
         if not (args and args[0]):
             raise subprocess.CalledProcessError(1, cmd="on_branch",
                                                 output="branch_name not supplied")
-        git_helper.checkout(args[0])
-        return func(*args, **kwargs)
+        with in_worktree(args[0]):
+            return func(*args, **kwargs)
     return func_wrapper
 
+@contextlib.contextmanager
+def in_worktree(branch):
+    """Changes into the worktree of branch for the with block, adding it first if need be.
+
+    Branches are never checked out in the developer's own tree, so switching between them rewrites
+    no files there, and Unity keeps its Library cache. An added worktree gets its submodules from
+    the local mirrors, and a copy of the sample app's Library (cloned where the filesystem can).
+    It stays until the run that added it succeeds (or, for a candidate, until promote), so that
+    --resume can pick up where a failed run stopped; `git worktree remove --force <path>` deletes
+    it by hand.
+    """
+    path = git_helper.worktree(branch)
+    if git_helper.is_added_worktree(path) and not os.path.exists(os.path.join(path, MOPUB_SDK_SUBMODULES[0], '.git')):
+        library = os.path.join(PRIVATE_REPO, SAMPLE_APP_LIBRARY)
+        cwd = os.getcwd()
+        os.chdir(path)
+        try:
+            submodule_mirror.recover()
+            if os.path.isdir(library) and not os.path.isdir(SAMPLE_APP_LIBRARY):
+                file_helper.sync_tree(library, SAMPLE_APP_LIBRARY)
+        finally:
+            os.chdir(cwd)
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        yield path
+    finally:
+        os.chdir(cwd)
+
+# The checkpoints and profiler trace file of the current run, set up by start_run.
+checkpoints = None
+trace_file = None
+
+def start_run(args):
+    """Records a checkpoint for every release step of this run, resuming a previous run if asked.
+
+    The state file and the run's profiler trace live in the private repo's .git directory, so they
+    are never committed.
+    """
+    global checkpoints, trace_file
+    git_dir = git_helper.session().git_dir
+    trace_file = os.path.join(git_dir, 'release-traces', '{}-{}-{}.json'.format(
+        args.func.__name__, args.version_string, time.strftime('%Y%m%d-%H%M%S')))
+    state_file = os.path.join(git_dir, 'release-state.json')
+    run_id = [args.func.__name__, args.version_string, getattr(args, 'release_hash', None),
+              getattr(args, 'test', False)]
+    checkpoints = checkpoint.Checkpoints(state_file, run_id, resume=args.resume)
+    if args.resume and checkpoints.previous:
+        print 'Resuming from {} recorded release step(s).'.format(len(checkpoints.previous))
+
+def finish_run():
+    """Writes the profiler trace of this run and prints a summary of its steps, slowest first.
+
+    The summary is compared against the previous trace of the same command, if there is one.
+    """
+    trace_dir, name = os.path.split(trace_file)
+    command = name.split('-')[0]
+    # the most recent by mtime: the names sort by version as a string, so 5.10.0 before 5.9.0
+    previous = [os.path.join(trace_dir, f) for f in os.listdir(trace_dir)
+                if f.startswith(command + '-')] if os.path.isdir(trace_dir) else []
+    profiler.trace.write(trace_file)
+    baseline = max(previous, key=os.path.getmtime) if previous else None
+    print '\n' + profiler.trace.summary('step', baseline)
+    print '\nRelease step timeline written to {} (open it in chrome://tracing)'.format(trace_file)
+
 def release_step(func):
-    """Decorator that prints a nice message after a step completes without raising an exception."""
+    """Decorator that prints a nice message after a step completes without raising an exception.
+
+    When checkpoints are enabled, steps already completed by the run being resumed are skipped.
+    """
     def func_wrapper(*args, **kwargs):
-        returnval = func(*args, **kwargs)
+        with profiler.step(func.__name__):
+            if checkpoints is None:
+                returnval = func(*args, **kwargs)
+            else:
+                skipped, returnval = checkpoints.run(func.__name__, args, kwargs,
+                                                     lambda: func(*args, **kwargs))
+        if checkpoints is not None and skipped:
+            print GREEN + "**** RELEASE STEP SKIPPED (checkpoint): {} ****".format(func.__name__) + END
+            return returnval
         print GREEN + "**** RELEASE STEP COMPLETED: {} ****".format(func.__name__) + END
         return returnval
     return func_wrapper
@@ -61,17 +145,25 @@ def create_release_branch(version_string, commit_hash=None, internal=False, test
     Uses the tip of master if no commit_hash is present.
     """
     if commit_hash is None:
-        if not test:
-            git_helper.checkout("master")
-            git_helper.pull()
-        commit_hash = git_helper.current_hash()
+        if test:
+            # test runs may start from any branch, like a feature branch of the release script
+            commit_hash = git_helper.current_hash()
+        else:
+            git_helper.pull_branch("master")
+            commit_hash = git_helper.session().resolve("refs/heads/master")
 
     internal_prefix = "internal-" if internal else ""
     release_branch = "{}release-{}".format(internal_prefix, version_string)
     # Check for existence of branch on origin, fail if it exists.
-    release_branch_found = os_helper.check_output("git ls-remote --heads origin | grep refs/heads/{}".format(release_branch))
+    ls_remote = os_helper.run("git ls-remote --heads origin | grep 'refs/heads/{}$'".format(
+        release_branch), capture=True, check=False)
+    # grep exits with 1 when nothing matches, so only a failure of ls-remote itself is an error
+    if ls_remote.returncodes[0] or ls_remote.returncodes[1] > 1:
+        raise subprocess.CalledProcessError(ls_remote.returncode, "git ls-remote --heads origin")
+    release_branch_found = ls_remote.output.strip()
     if test or not release_branch_found:
-        os_helper.check_call("git checkout -b {} {}".format(release_branch, commit_hash))
+        # the branch is worked on in a worktree of its own, added by its first on_branch step
+        os_helper.check_call("git branch {} {}".format(release_branch, commit_hash))
         return release_branch
     else:
         raise subprocess.CalledProcessError(
@@ -83,18 +175,13 @@ def create_release_branch(version_string, commit_hash=None, internal=False, test
 @release_step
 def strip_private_lines(branch_name):
     """Removes lines from various files that can carry private information"""
-    strip_lines.process_directory('.')
+    stripped = strip_lines.process_directory('.')
+    print 'Stripped {} private line(s) from {} file(s)'.format(sum(stripped.values()), len(stripped))
 
 @on_branch
 @release_step
 def update_sample_app_version(branch_name, version_string):
     """Update the bundle version and Android/iOS version codes in the sample app"""
-    # update platform-independent bundle version
-    bundle_version_pattern = re.compile(r'  bundleVersion: .*')
-    bundle_version_replacement = r'  bundleVersion: {}'.format(version_string)
-    replace_file_lines(SAMPLE_APP_PROJECT_SETTINGS,
-            (bundle_version_pattern, bundle_version_replacement))
-
     # convert version into bundle code
     major,minor,patch = version_string.split('.')
     if len(minor) == 1:
@@ -102,26 +189,21 @@ def update_sample_app_version(branch_name, version_string):
         minor = minor + '0'
     bundle_code = major + minor + patch
 
-    # update per-platform bundle code
-    ios_bundle_code_pattern = re.compile(r'    iOS: \d+')
-    ios_bundle_code_replacement = r'    iOS: {}'.format(bundle_code)
-    replace_file_lines(SAMPLE_APP_PROJECT_SETTINGS,
-            (ios_bundle_code_pattern, ios_bundle_code_replacement))
-    android_bundle_code_pattern = re.compile(r'  AndroidBundleVersionCode: \d+')
-    android_bundle_code_replacement = r'  AndroidBundleVersionCode: {}'.format(bundle_code)
-    replace_file_lines(SAMPLE_APP_PROJECT_SETTINGS,
-            (android_bundle_code_pattern, android_bundle_code_replacement))
-
-def clear_mopub_defines(m):
-    """Helper function to compute a replacement string from the regex match object.  This is
-    specific to the Scripting Defines lines in Unity's ProjectSettings.asset file, each of
-    which has a semicolon-separated list of symbols.  We need to filter out the 'mopub_developer',
-    'mopub_native_beta' and 'mopub_menu_beta' symbols and then clean up semicolons correctly.  Use
-    split() and join() to do so.
+    # platform-independent bundle version, then per-platform bundle codes; the file is written once
+    settings = unity_yaml.UnityYaml(SAMPLE_APP_PROJECT_SETTINGS)
+    settings.set('PlayerSettings.bundleVersion', version_string)
+    settings.set('PlayerSettings.buildNumber.iOS', bundle_code)
+    settings.set('PlayerSettings.AndroidBundleVersionCode', bundle_code)
+    settings.save()
+
+def clear_mopub_defines(defines):
+    """Returns the semicolon-separated list of Scripting Define Symbols from Unity's
+    ProjectSettings.asset without the 'mopub_developer', 'mopub_native_beta' and
+    'mopub_build_menu_beta' symbols, with the semicolons cleaned up.
     """
-    return m.group(1) + ';'.join(filter(
+    return ';'.join(filter(
         lambda d: d != 'mopub_developer' and d != 'mopub_native_beta' and d != 'mopub_build_menu_beta',
-        m.group(2).split(';')))
+        defines.split(';')))
 
 @on_branch
 @release_step
@@ -129,15 +211,19 @@ def make_build_scripts_use_public_sdks(branch_name):
     """Changes the value of INTERNAL_SDK in the build scripts to false"""
     internal_sdk_line_pattern = re.compile(r':.*INTERNAL_SDK:=.*')
     replacement = r': "${INTERNAL_SDK:=false}"'
-    replace_file_lines(ANDROID_BUILD_SCRIPT, (internal_sdk_line_pattern, replacement))
-    replace_file_lines(IOS_BUILD_SCRIPT, (internal_sdk_line_pattern, replacement))
-    # Reclaim execute permissions lost in replace_file_lines
-    os_helper.call("chmod +x {}".format(ANDROID_BUILD_SCRIPT))
-    os_helper.call("chmod +x {}".format(IOS_BUILD_SCRIPT))
     # Remove all 'mopub_*' symbols from sample app's defines, so that the corresponding
-    # options are disabled by default.
-    define_pattern = re.compile(r'(\s*\d+:\s*)(.*)')
-    replace_file_lines(SAMPLE_APP_PROJECT_SETTINGS, (define_pattern, clear_mopub_defines))
+    # options are disabled by default. These are edited in memory first, so that nothing is
+    # written unless every edit can be made.
+    settings = unity_yaml.UnityYaml(SAMPLE_APP_PROJECT_SETTINGS)
+    defines = 'PlayerSettings.scriptingDefineSymbols'
+    for group in settings.keys(defines):
+        path = '{}.{}'.format(defines, group)
+        settings.set(path, clear_mopub_defines(settings.get(path)))
+    edits = file_helper.FileEdits()
+    edits.replace(ANDROID_BUILD_SCRIPT, (internal_sdk_line_pattern, replacement))
+    edits.replace(IOS_BUILD_SCRIPT, (internal_sdk_line_pattern, replacement))
+    apply_file_edits(edits)
+    settings.save()
     # TODO: remove Android platform from native-static.jar
 
 def replace_file_lines(fname, *args):
@@ -150,54 +236,38 @@ def replace_file_lines(fname, *args):
       First pattern: (a, a)
       Second pattern: (a, c)
       The second pattern will never match, since the first pattern is identical to it.
+    To edit several files at once, queue them on a file_helper.FileEdits and use apply_file_edits.
     """
-    replacement_succeeded = [False for arg in args]
-    with open(fname, 'r') as infile, open(fname + '.tmp', 'w') as outfile:
-        for line in infile:
-            for i, pattern in enumerate(args):
-                # This will raise an IndexError if the args are not structured properly
-                regex, replacement = pattern[0], pattern[1]
-                (outline, replaced) = regex.subn(replacement, line)
-                if replaced > 0:
-                    replacement_succeeded[i] = True
-                    break
-            outfile.write(outline)
-        if all(replacement_succeeded):
-            os_helper.check_call('mv {} {}'.format(fname + '.tmp', fname))
-        else:
-            error_output = "Didn't find all provided patterns in {}\n\tPatterns:".format(fname)
-            for arg in args:
-                error_output += \
-                    "\n\tpattern: {} replacement: {}".format(arg[0], arg[1])
-            print RED + error_output + END
-            raise subprocess.CalledProcessError(
-                1,
-                cmd="replace_file_lines",
-                output=error_output)
+    apply_file_edits(file_helper.FileEdits().replace(fname, *args))
+
+def apply_file_edits(edits):
+    """Applies the queued file_helper.FileEdits, printing any unmatched patterns before raising."""
+    try:
+        edits.apply()
+    except subprocess.CalledProcessError as e:
+        print RED + e.output + END
+        raise
 
 @release_step
 def update_mopub_sdk_submodules(external_only=False):
-    """Pulls the latest MoPub Android and iOS SDK releases, both internal and external"""
-    os_helper.check_call('git --git-dir mopub-android-sdk/.git pull origin master')
-    os_helper.check_call('git --git-dir mopub-ios-sdk/.git pull origin master')
-    if not external_only:
-        os_helper.check_call('git --git-dir mopub-android/.git pull origin master')
-        os_helper.check_call('git --git-dir mopub-ios/.git pull origin master')
+    """Pulls the latest MoPub Android and iOS SDK releases, both internal and external
+
+    They are fetched concurrently, through local mirrors shared with every other checkout.
+    """
+    submodules = MOPUB_SDK_SUBMODULES if external_only else \
+        MOPUB_SDK_SUBMODULES + INTERNAL_MOPUB_SDK_SUBMODULES
+    submodule_mirror.update_all(submodules)
 
 @release_step
 def reset_mopub_sdk_submodules():
     """Resets the git state of the Android and iOS submodules"""
-    os_helper.check_call('git --git-dir mopub-android-sdk/.git checkout .')
-    os_helper.check_call('git --git-dir mopub-android-sdk/.git clean -df')
-    os_helper.check_call('git --git-dir mopub-ios-sdk/.git checkout .')
-    os_helper.check_call('git --git-dir mopub-ios-sdk/.git clean -df')
-
-@on_branch
-@release_step
-def recover_mopub_sdk_submodules(branch):
-    """Brings back the Android and iOS submodules"""
-    os_helper.check_call('git submodule init')
-    os_helper.check_call('git submodule update --recursive')
+    steps = scheduler.Scheduler()
+    for submodule in MOPUB_SDK_SUBMODULES:
+        checkout = steps.add('checkout ' + submodule, os_helper.check_call,
+                             'git --git-dir {}/.git checkout .'.format(submodule))
+        steps.add('clean ' + submodule, os_helper.check_call,
+                  'git --git-dir {}/.git clean -df'.format(submodule), deps=[checkout])
+    steps.run()
 
 @on_branch
 @release_step
@@ -210,8 +280,55 @@ def commit_all_changes(branch_name, commit_message=None, extra_args=""):
 @on_branch
 @release_step
 def build_wrappers_and_export_unity_package(branch_name):
-    """Runs the build.sh script."""
-    os_helper.check_call("./scripts/build.sh")
+    """Does what the build.sh script does, reusing cached Android AARs when their inputs are unchanged.
+
+    The package is written by unitypackage.py rather than by exporting it from the Unity editor,
+    once meta_index.py has checked that every asset has a .meta file with a GUID of its own.
+    """
+    cache_key = build_cache.key()
+    if build_cache.restore(cache_key):
+        print 'Restored Android AARs from the build cache ({})'.format(cache_key)
+    else:
+        os_helper.check_call("./scripts/build-android.sh")
+        build_cache.store(cache_key)
+    problems = meta_index.check().problems()
+    if problems:
+        raise subprocess.CalledProcessError(1, cmd="meta_index.check", output='\n'.join(problems))
+    count, compressed = unitypackage.write_package()
+    print 'Exported {} assets ({} recompressed) to {}'.format(count, compressed, unitypackage.DEST_PACKAGE)
+
+@on_branch
+@release_step
+def run_unit_tests(branch_name):
+    """Runs the editor tests against the release branch, failing the release if any fail.
+
+    They run in a throwaway clone of the sample app, so nothing the editor or the Play Services
+    Resolver rewrites ends up in the release commit; the step fails if a tracked file changed all
+    the same. Unity is stopped as soon as its log shows the scripts don't compile.
+    """
+    before = os_helper.check_output('git diff HEAD --binary')
+    clone = os.path.abspath(os.path.join(unity_runner.PROJECT_PATH, 'Temp', 'unit-test-clone'))
+    if not os.path.isdir(os.path.dirname(clone)):
+        os.makedirs(os.path.dirname(clone))
+    try:
+        sample_apps.clone_project(unity_runner.PROJECT_PATH, clone)
+        returncode = unity_runner.run_tests(clone)
+    finally:
+        if os.path.isdir(clone):
+            shutil.rmtree(clone)
+    if os_helper.check_output('git diff HEAD --binary') != before:
+        raise subprocess.CalledProcessError(1, cmd="run_unit_tests",
+                                            output="The editor tests changed tracked files:\n" +
+                                            os_helper.check_output('git diff HEAD --stat'))
+    if not os.path.isfile(nunit_report.TEST_RESULTS):
+        raise subprocess.CalledProcessError(returncode or 1, cmd="run_unit_tests",
+                                            output="The editor tests didn't run; see {}.".format(
+                                                unity_runner.TEST_LOG))
+    report = nunit_report.analyze()
+    print report.format()
+    if returncode or report.counts['failed'] or not report.total:
+        raise subprocess.CalledProcessError(returncode or 1, cmd="run_unit_tests",
+                                            output=report.format())
 
 @on_branch
 @release_step
@@ -238,28 +355,75 @@ def push_private_release_branch(branch_name, version_string, internal=False):
 def prepare_public_repo(public_repo, staging_dir):
     """Sets up the public repo to stage the next release.
 
-    Copies the git history to a safe space, then cleans out the directory.
+    Moves the git history out of the way into staging_dir, which must be on the same filesystem.
+    Does nothing if it has been moved already, by a run that was stopped before moving it back.
     """
+    if os.path.isdir(os.path.join(staging_dir, '.git')) and \
+            not os.path.exists(os.path.join(public_repo, '.git')):
+        return
     cwd = os.getcwd()
     os.chdir(public_repo)
 
     # remember what things used to be like
     os_helper.call('git checkout master')
     os_helper.call('git pull')
-    os_helper.call('cp -r .git {}'.format(staging_dir))
     os.chdir(cwd)
+    os.rename(os.path.join(public_repo, '.git'), os.path.join(staging_dir, '.git'))
 
 @on_branch
 @release_step
-def copy_release_branch_to(branch_name, public_repo):
-    """Copies the tagged release branch to the given directory."""
-    os_helper.call('rsync -aWL --delete . {}'.format(public_repo))
+def copy_release_branch_to(branch_name, public_repo, link=False):
+    """Copies the tagged release branch to the given directory, writing only the files that changed.
+
+    With link, changed files are hardlinked rather than cloned or copied. The .git files of
+    submodules are left alone on both sides: the worktree's point into its own git dir.
+    """
+    counts = file_helper.sync_tree('.', public_repo, link=link, exclude_nested=('.git',))
+    print 'Synced release branch to {}: {unchanged} unchanged, {linked} linked, {cloned} cloned, ' \
+        '{copied} copied, {deleted} deleted'.format(public_repo, **counts)
 
 @release_step
 def fix_git_history(public_repo, staging_dir):
-    """Restores the git history that was copied into the given staging directory."""
-    os_helper.call('rm -rf {}/.git'.format(public_repo))
-    os_helper.call('cp -r {}/.git {}'.format(staging_dir, public_repo))
+    """Restores the git history that was moved into the given staging directory.
+
+    Does nothing if it has been restored already.
+    """
+    if os.path.exists(os.path.join(public_repo, '.git')) and \
+            not os.path.exists(os.path.join(staging_dir, '.git')):
+        return
+    os.rename(os.path.join(staging_dir, '.git'), os.path.join(public_repo, '.git'))
+
+@release_step
+def check_public_submodules(public_repo):
+    """Fails unless the SDK submodules of the public repo are still git repositories of their own."""
+    for submodule in MOPUB_SDK_SUBMODULES:
+        path = os.path.join(public_repo, submodule)
+        try:
+            toplevel = os_helper.check_output('git -C {} rev-parse --show-toplevel'.format(path)).strip()
+        except subprocess.CalledProcessError:
+            toplevel = None
+        # an uninitialized submodule resolves to the public repo itself
+        if toplevel is None or os.path.realpath(toplevel) != os.path.realpath(path):
+            raise subprocess.CalledProcessError(1, cmd="check_public_submodules",
+                                                output="Not a git repository: {}".format(path))
+
+@release_step
+def sync_public_repo(branch_name, public_repo, staging_dir, link=False):
+    """Copies the release branch over the public repo, keeping the public repo's git history.
+
+    Its history is moved into staging_dir for the copy, and back again even if the copy fails.
+    The three are a single step, so that --resume never skips moving the history away on the
+    strength of a checkpoint whose effect was undone.
+    """
+    if not os.path.isdir(staging_dir):
+        os.mkdir(staging_dir)
+    prepare_public_repo(public_repo, staging_dir)
+    try:
+        copy_release_branch_to(branch_name, public_repo, link=link)
+    finally:
+        fix_git_history(public_repo, staging_dir)
+    # rmdir, which never takes the public repo's history with it if it is still there
+    os.rmdir(staging_dir)
 
 @on_branch
 @release_step
@@ -269,30 +433,62 @@ def remove_internal_submodules(branch_name):
     os_helper.call('git rm -f mopub-ios')
 
 @release_step
-def remove_unreleased_code():
+def remove_unreleased_code(dry_run=False):
     """Remove all the code directories that we shouldn't package in the release."""
-    os_helper.call('rm -rf scripts/private')
-    os_helper.call('find . -name *.aar* -not -path "/mopub-android-sdk/*" -delete')
-    os_helper.call('find . -name unity*.jar -delete')
-    os_helper.call('find . -name chartboost*.jar -delete')
-    os_helper.call('find . -name dagger*.jar -delete')
-    os_helper.call('find . -name javax.inject*.jar -delete')
-    os_helper.call('find . -name vungle*.jar -delete')
+    globs = file_helper.GlobSet(UNRELEASED_FILE_PATTERNS, UNRELEASED_EXCLUDED_PATTERNS)
+    removed = file_helper.prune_tree('.', globs, dry_run=dry_run)
+    print '{} {} unreleased paths{}'.format('Found' if dry_run else 'Removed', len(removed),
+                                            ':' if removed else '')
+    for relpath in removed:
+        print '\t' + relpath
+    return removed
+
+def list_unreleased_code(args):
+    """Lists what promote would remove from the checkout, without removing anything."""
+    cwd = os.getcwd()
+    os.chdir(args.path)
+    try:
+        remove_unreleased_code(dry_run=True)
+    finally:
+        os.chdir(cwd)
+    exit(0)
 
 @release_step
 def commit_public_release(version_string):
-    """Commits the release on the local public repo, ready for push to origin."""
+    """Commits the release on the local public repo, ready for push to origin.
+
+    The package's manifest is committed next to it, so later releases can be compared against it
+    without unpacking anything.
+    """
+    manifest = package_manifest.package_manifest(unitypackage.DEST_PACKAGE)
+    package_manifest.write(manifest, package_manifest.MANIFEST)
+    print 'Wrote the manifest of {} assets to {}'.format(len(manifest), package_manifest.MANIFEST)
     os_helper.call('git add -A .')
     commit_all_changes("master", "Release: version {}".format(version_string))
     os_helper.call('git tag -f -a "v{}" -m "Version: {}"'.format(version_string, version_string))
 
+@release_step
+def publish_public_release(version_string):
+    """Strips unreleased code from the public repo, updates its SDK submodules, commits the release.
+
+    The steps are a DAG: removing the unreleased code skips the SDK submodules, so it runs alongside
+    resetting and then updating them, and the release is committed once both are done. As nested
+    steps they share this step's checkpoint, whose state isn't kept per thread.
+    """
+    steps = scheduler.Scheduler()
+    steps.add('remove_unreleased_code', remove_unreleased_code)
+    reset = steps.add('reset_mopub_sdk_submodules', reset_mopub_sdk_submodules)
+    steps.add('update_mopub_sdk_submodules', update_mopub_sdk_submodules, external_only=True,
+              deps=[reset])
+    steps.run()
+    # commit_all_changes changes into master's worktree, which the scheduler's threads mustn't do
+    commit_public_release(version_string)
+
 @on_branch
 @release_step
 def cherry_pick_to_master(branch_name):
-    """Cherry picks the last commit from the given branch onto master."""
-    os_helper.call('git checkout master')
-    os_helper.call('git cherry-pick -x --allow-empty {}'.format(branch_name))
-    os_helper.call('git checkout -')
+    """Cherry picks the last commit from the given branch onto master, without checking it out."""
+    git_helper.cherry_pick(branch_name, 'master')
 
 def VersionString(version):
     matched_version = re.match(r"\d+\.\d+\.\d+([+-]\w+)?$", version)
@@ -319,13 +515,15 @@ def create_internal_candidate(args):
     else:
         print 'This script is running in TEST mode.  It will not push the release candidate branch.\n '
     raw_input('Press Enter to continue...(Ctrl+C to Cancel)\n')
+    start_run(args)
 
     try:
         release_branch = create_release_branch(args.version_string, args.release_hash,
                                                internal=True, test=args.test)
 
         # changes that also apply to private master
-        update_mopub_sdk_submodules()
+        with in_worktree(release_branch):
+            update_mopub_sdk_submodules()
         commit_all_changes(release_branch, "Update to latest Android and iOS MoPub SDKs",
                            "--allow-empty")
         update_sample_app_version(release_branch, args.version_string)
@@ -334,16 +532,23 @@ def create_internal_candidate(args):
 
         # changes only for public repo
         build_wrappers_and_export_unity_package(release_branch)
+        if not args.skip_unit_tests:
+            run_unit_tests(release_branch)
         commit_release_branch(release_branch, args.version_string, internal=True)
         if not args.test:
             push_private_release_branch(release_branch, args.version_string, internal=True)
 
+        # nothing else works on an internal candidate, so its worktree can go
+        git_helper.remove_worktree(release_branch)
         print GREEN + "HOORAY! Internal candidate branch created {}!! Run through release testing then create release candidate once SDKs have been released.".format(release_branch) + END
+        checkpoints.clear()
         exit(0)
     except subprocess.CalledProcessError as e:
         print RED + "RELEASE SCRIPT FAILED" + END
         print e.output
         raise
+    finally:
+        finish_run()
 
 def create_candidate(args):
     # Verify before performing potentially destructive behavior
@@ -352,12 +557,14 @@ def create_candidate(args):
     else:
         print 'This script is running in TEST mode.  It will not push the release candidate branch.\n '
     raw_input('Press Enter to continue...(Ctrl+C to Cancel)\n')
+    start_run(args)
 
     try:
         release_branch = create_release_branch(args.version_string, args.release_hash, test=args.test)
 
         # changes that also apply to private master
-        update_mopub_sdk_submodules()
+        with in_worktree(release_branch):
+            update_mopub_sdk_submodules()
         commit_all_changes(release_branch, "Update to latest Android and iOS MoPub SDKs",
                            "--allow-empty")
         if not args.test:
@@ -374,45 +581,58 @@ def create_candidate(args):
         remove_internal_submodules(release_branch)
         strip_private_lines(release_branch)
         build_wrappers_and_export_unity_package(release_branch)
+        if not args.skip_unit_tests:
+            run_unit_tests(release_branch)
         commit_release_branch(release_branch, args.version_string)
         if not args.test:
             push_private_release_branch(release_branch, args.version_string)
 
+        if args.test:
+            # promote reuses a candidate's worktree, but test candidates are never promoted
+            git_helper.remove_worktree(release_branch)
         print GREEN + "HOORAY! Candidate branch created {}!! Run through release testing then promote it.".format(release_branch) + END
+        checkpoints.clear()
         exit(0)
     except subprocess.CalledProcessError as e:
         print RED + "RELEASE SCRIPT FAILED" + END
         print e.output
         raise
+    finally:
+        finish_run()
 
 def promote_to_release(args):
     # Verify before performing potentially destructive behavior
     print 'This script will take a tagged release candidate and publish it on the public repo.'
     raw_input('Press Enter to continue...(Ctrl+C to Cancel)\n')
+    start_run(args)
 
     try:
-        with os_helper.mktempdir() as git_history_dir:
-            prepare_public_repo(PUBLIC_REPO, git_history_dir)
-            copy_release_branch_to("release-{}".format(args.version_string), PUBLIC_REPO)
-            fix_git_history(PUBLIC_REPO, git_history_dir)
+        # stage next to the public repo, so its .git can be moved rather than copied. The path is
+        # the same on every run of this version, so the step taking it matches its checkpoint on
+        # --resume.
+        git_history_dir = os.path.join(WORKSPACE, '.mopub-unity-sdk-staging-{}'.format(args.version_string))
+        sync_public_repo("release-{}".format(args.version_string), PUBLIC_REPO, git_history_dir,
+                         link=args.hardlink)
+        check_public_submodules(PUBLIC_REPO)
 
         cwd = os.getcwd()
         os.chdir(PUBLIC_REPO)
-        remove_unreleased_code()
-        reset_mopub_sdk_submodules()
-        update_mopub_sdk_submodules(external_only=True)
-        commit_public_release(args.version_string)
+        publish_public_release(args.version_string)
         os.chdir(cwd)
-        recover_mopub_sdk_submodules('master')
+        # the release branches were worked on in worktrees of their own, so this tree is as it was
+        git_helper.remove_worktrees()
 
         print GREEN + '\nRelease preparation completed. On private master you have 1 commit to review and push.'
         print '\nOn public master you have 1 commit to review and push. Make sure to push tags:'
         print '\t\'git push --tags origin master\''
+        checkpoints.clear()
         exit(0)
     except subprocess.CalledProcessError as e:
         print RED + "RELEASE SCRIPT FAILED" + END
         print e.output
         raise
+    finally:
+        finish_run()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -423,6 +643,10 @@ if __name__ == "__main__":
     version_parser.add_argument("version_string",
                                 type=VersionString,
                                 help="The release version. Format is like '3.5.2'")
+    version_parser.add_argument("--resume",
+                                action='store_true',
+                                help="Skips the steps already completed by a failed run of the same command.",
+                                default=False)
  
     release_hash_parser = argparse.ArgumentParser(add_help=False, parents=[version_parser])
     release_hash_parser.add_argument("--release_hash",
@@ -433,6 +657,10 @@ if __name__ == "__main__":
                                      action='store_true',
                                      help="Suppresses cherry picks and push to origin.",
                                      default=False)
+    release_hash_parser.add_argument("--skip_unit_tests",
+                                     action='store_true',
+                                     help="Doesn't run the editor tests, which need UNITY_BIN, before committing.",
+                                     default=False)
 
     internal_candidate_parser = subparsers.add_parser('internal-candidate', parents=[release_hash_parser])
     internal_candidate_parser.set_defaults(func=create_internal_candidate)
@@ -441,8 +669,21 @@ if __name__ == "__main__":
     candidate_parser.set_defaults(func=create_candidate)
 
     promote_parser = subparsers.add_parser('promote', parents=[version_parser])
+    promote_parser.add_argument("--hardlink",
+                                action='store_true',
+                                help="Hardlink changed files into the public repo instead of copying them. "
+                                     "Only safe if nothing will edit either repo's files in place.",
+                                default=False)
     promote_parser.set_defaults(func=promote_to_release)
 
+    unreleased_parser = subparsers.add_parser('unreleased',
+                                              help="List the files promote removes, without removing them")
+    unreleased_parser.add_argument("path",
+                                   nargs='?',
+                                   help="The checkout to look in. Defaults to this repo.",
+                                   default=PRIVATE_REPO)
+    unreleased_parser.set_defaults(func=list_unreleased_code)
+
     prog_args = parser.parse_args()
     prog_args.func(prog_args)
 
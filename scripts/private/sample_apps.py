@@ -0,0 +1,126 @@
+#! /usr/bin/python2.7
+"""Builds the sample app for several platforms at once, each in its own clone of the project.
+
+Unity locks a project while it has it open, so two editors can't build the same project. Each
+platform gets a clone of unity-sample-app under the project's Temp folder instead: Assets and the
+other source folders are hardlinked, so a clone takes no space and next to no time to make, while
+ProjectSettings (which the editor saves when it switches build target), Library and the Assets
+folders the Play Services Resolver writes into are copies (as copy-on-write clones where the
+filesystem supports them). Temp starts out empty. A copy of the project's Library saves each editor
+importing every asset again.
+
+A hardlinked file is shared with the project, so anything else the editor writes in place (rather
+than replacing), like a .meta file it upgrades, changes the project as well.
+
+The editors run under unity_runner.py, at most MAX_BUILDS at a time (set MOPUB_MAX_BUILDS to
+change it). Each writes its log to scripts/<platform>buildlog.txt, as build-sample-apps.sh always
+has, and its build is moved to the project's Build folder. The clones are deleted afterwards.
+
+    sample_apps.py [--workers N] [--keep-clones] PLATFORM...
+A stub UNITY_BIN like unity_stub.py is enough to exercise it.
+"""
+import argparse, glob, os, shutil, subprocess, sys
+import file_helper, os_helper, scheduler, unity_runner
+
+PROJECT_PATH = unity_runner.PROJECT_PATH
+LOG_DIR = 'scripts'
+BUILD_LOG_NAME = 'buildlog.txt'
+MAX_BUILDS = int(os.environ.get('MOPUB_MAX_BUILDS', 2))
+# Top-level project folders that are copied rather than hardlinked into the clones, or left out
+COPIED = ('ProjectSettings', 'Library')
+SKIPPED = ('Temp', 'Build', 'Logs', 'obj')
+# Folders under Assets that are copied too, because the resolver writes into them during a build
+COPIED_ASSETS = ('PlayServicesResolver', 'Plugins')
+
+
+def clone_project(project_path, dest):
+    """Makes dest a clone of the Unity project at project_path, sharing its source files."""
+    counts = file_helper.sync_tree(project_path, dest, exclude=COPIED + SKIPPED + ('.git', 'Assets'),
+                                   link=True)
+    assets = os.path.join(project_path, 'Assets')
+    if os.path.isdir(assets):
+        _add(counts, file_helper.sync_tree(assets, os.path.join(dest, 'Assets'),
+                                           exclude=COPIED_ASSETS + ('.git',), link=True))
+    for name in COPIED + tuple(os.path.join('Assets', name) for name in COPIED_ASSETS):
+        if os.path.isdir(os.path.join(project_path, name)):
+            _add(counts, file_helper.sync_tree(os.path.join(project_path, name),
+                                               os.path.join(dest, name)))
+    return counts
+
+def _add(counts, more):
+    for key in counts:
+        counts[key] += more[key]
+
+def build(platform, project_path=PROJECT_PATH, clone_dir=None, last_commit=None, log_dir=LOG_DIR,
+          timeout=None):
+    """Builds the sample app for platform in a clone of the project. Returns the build's path.
+
+    The clone is made in clone_dir, and left there for the caller to delete.
+    """
+    project_path = os.path.abspath(project_path)
+    if last_commit is None:
+        last_commit = os_helper.check_output('git rev-parse --short HEAD').strip()
+    log_file = os.path.abspath(os.path.join(log_dir, platform + BUILD_LOG_NAME))
+    clone = os.path.join(clone_dir, platform)
+    counts = clone_project(project_path, clone)
+    print 'Cloned {} into {} ({} linked, {} cloned, {} copied)'.format(
+        project_path, clone, counts['linked'], counts['cloned'], counts['copied'])
+
+    print 'Running Unity build for {}...'.format(platform)
+    returncode = unity_runner.run([
+        unity_runner.unity_bin(), '-buildTarget', platform,
+        '-executeMethod', 'MoPubSampleBuild.PerformBuild', 'lastCommit=' + last_commit,
+        '-projectPath', clone, '-force-free', '-quit', '-batchmode', '-logFile', log_file],
+        timeout=timeout)
+    builds = glob.glob(os.path.join(clone, 'Build', '*{}*{}*'.format(platform, last_commit)))
+    if returncode or not builds:
+        raise subprocess.CalledProcessError(
+            returncode or 1, cmd='build ' + platform,
+            output='Building the {} sample app has failed, please check {}'.format(platform, log_file))
+
+    out_dir = os.path.join(project_path, 'Build')
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    dest = os.path.join(out_dir, os.path.basename(builds[0]))
+    if os.path.isdir(dest):
+        shutil.rmtree(dest)
+    elif os.path.lexists(dest):
+        os.remove(dest)
+    os.rename(builds[0], dest)
+    print 'Built {}'.format(dest)
+    return dest
+
+def build_all(platforms, project_path=PROJECT_PATH, max_workers=MAX_BUILDS, keep_clones=False,
+              **kwargs):
+    """Builds the sample app for every platform concurrently. Returns {platform: build path}.
+
+    Takes build()'s keyword arguments too.
+    """
+    # the clones share a filesystem with the project, which the hardlinks need
+    clone_dir = os.path.abspath(os.path.join(project_path, 'Temp', 'sample-app-clones'))
+    if not os.path.isdir(clone_dir):
+        os.makedirs(clone_dir)
+    try:
+        steps = scheduler.Scheduler(max_workers)
+        for platform in platforms:
+            steps.add(platform, build, platform, project_path, clone_dir, **kwargs)
+        return steps.run()
+    finally:
+        if not keep_clones and os.path.isdir(clone_dir):
+            shutil.rmtree(clone_dir)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build the sample app for several platforms at once.')
+    parser.add_argument('platforms', nargs='+', help='Unity build targets, e.g. Android iOS')
+    parser.add_argument('--project', default=PROJECT_PATH,
+                        help='The Unity project to build. Defaults to {}.'.format(PROJECT_PATH))
+    parser.add_argument('--workers', type=int, default=MAX_BUILDS,
+                        help='How many builds run at once. Defaults to {}.'.format(MAX_BUILDS))
+    parser.add_argument('--keep-clones', action='store_true',
+                        help="Don't delete the project clones afterwards.")
+    args = parser.parse_args()
+    try:
+        build_all(args.platforms, args.project, args.workers, args.keep_clones)
+    except subprocess.CalledProcessError as e:
+        print >> sys.stderr, '\033[0;31m{}\033[0m'.format(e.output)
+        sys.exit(1)
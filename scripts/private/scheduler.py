@@ -0,0 +1,140 @@
+"""Runs release steps that don't depend on each other concurrently."""
+import collections, sys, threading, Queue
+
+DEFAULT_MAX_WORKERS = 4
+
+Step = collections.namedtuple('Step', 'name func args kwargs deps')
+
+
+class _StepOutput(object):
+    """Stands in for sys.stdout while steps run, buffering each step thread's output separately.
+
+    It has no fileno(), so os_helper pipes subprocess output through it as well.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffers = {}
+
+    def write(self, text):
+        self.buffers.get(threading.current_thread().ident, self.stream).write(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        self.stream.flush()
+
+
+class _Buffer(object):
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, text):
+        self.chunks.append(text)
+
+
+class Scheduler(object):
+    """A DAG of steps, run on up to max_workers threads as soon as their dependencies finish.
+
+    Steps must be added after the steps they depend on, which also rules out cycles. Each step's
+    output is buffered and printed as one block, in the order the steps were added, so logs are
+    the same from run to run. When a step fails, no further steps are started; the ones already
+    running are waited for, and then the first failure is re-raised.
+
+    Steps run in threads of this process, so they must not chdir or check out branches.
+    """
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        self.max_workers = max_workers
+        self.steps = collections.OrderedDict()
+
+    def add(self, name, func, *args, **kwargs):
+        """Adds a step calling func(*args, **kwargs) once the steps named in deps= have finished."""
+        deps = tuple(kwargs.pop('deps', ()))
+        if name in self.steps:
+            raise ValueError("Duplicate step: {}".format(name))
+        for dep in deps:
+            if dep not in self.steps:
+                raise ValueError("Step {} depends on unknown step {}".format(name, dep))
+        self.steps[name] = Step(name, func, args, kwargs, deps)
+        return name
+
+    def run(self):
+        """Runs every step, returning a dict of step name to return value."""
+        output = _StepOutput(sys.stdout)
+        done = Queue.Queue()
+        pending = list(self.steps.values())
+        running = set()
+        results = {}
+        failures = []
+        logs = {}
+        printed = 0
+
+        sys.stdout = output
+        try:
+            while pending or running:
+                if not failures:
+                    for step in list(pending):
+                        if len(running) >= self.max_workers:
+                            break
+                        if all(dep in results for dep in step.deps):
+                            pending.remove(step)
+                            running.add(step.name)
+                            self._start(step, output, done)
+                if not running:
+                    break
+                name, result, exc_info, log = done.get()
+                running.discard(name)
+                logs[name] = log
+                if exc_info is None:
+                    results[name] = result
+                else:
+                    failures.append(exc_info)
+                printed = self._print_logs(logs, printed, output.stream)
+        finally:
+            sys.stdout = output.stream
+
+        # steps that finished after an earlier one was cancelled still get their logs printed
+        for name in self.steps:
+            if name in logs:
+                print "---- {} ----\n{}".format(name, logs.pop(name)),
+        for step in pending:
+            print "---- {} (cancelled) ----".format(step.name)
+        if failures:
+            raise failures[0][0], failures[0][1], failures[0][2]
+        return results
+
+    def _start(self, step, output, done):
+        def run_step():
+            buf = _Buffer()
+            output.buffers[threading.current_thread().ident] = buf
+            try:
+                result = step.func(*step.args, **step.kwargs)
+                exc_info = None
+            except BaseException:
+                # BaseException, so that KeyboardInterrupt and SystemExit are passed on too
+                result, exc_info = None, sys.exc_info()
+            finally:
+                del output.buffers[threading.current_thread().ident]
+            done.put((step.name, result, exc_info, ''.join(buf.chunks)))
+        thread = threading.Thread(target=run_step, name=step.name)
+        thread.daemon = True
+        thread.start()
+
+    def _print_logs(self, logs, printed, stream):
+        """Prints the logs of finished steps, in the order they were added; returns how many are."""
+        names = list(self.steps.keys())
+        while printed < len(names) and names[printed] in logs:
+            name = names[printed]
+            stream.write("---- {} ----\n{}".format(name, logs.pop(name)))
+            printed += 1
+        stream.flush()
+        return printed
+
+
+def run_all(named_calls, max_workers=DEFAULT_MAX_WORKERS):
+    """Runs independent (name, func, args...) calls concurrently; returns {name: result}."""
+    scheduler = Scheduler(max_workers)
+    for call in named_calls:
+        scheduler.add(*call)
+    return scheduler.run()
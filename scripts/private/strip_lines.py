@@ -2,30 +2,194 @@
 """Removes lines containing private information from all text files in a subdirectory tree.
 
 This includes lines that start with // TODO, //TODO, * TODO or *TODO from all files ending in .cs
-It also removes the Team Id from the .asset file under Unity's ProjectSettings directory.
+It also removes the Team Id from the .asset file under Unity's ProjectSettings directory, and the
+default Xcode team id from the sample app build script.
+
+What gets removed is driven by RULES; see the comment on Rule for how to add more.
 """
 
-import argparse, os, re, sys
+import argparse, collections, difflib, fnmatch, io, multiprocessing, os, re, shutil, sys
+
+FLAGS = re.UNICODE | re.IGNORECASE
+LINE = 'line'
+INLINE = 'inline'
+
+# A single redaction rule:
+#   glob: fnmatch pattern for the file's base name.
+#   kind: LINE drops every line the regex matches (from the start of the line);
+#         INLINE substitutes the replacement for every match within a line.
+#   regex: the pattern, as a string. It must not use numbered backreferences inside the pattern,
+#          since all rules for a file are folded into one alternation.
+#   replacement: the INLINE replacement template (None for LINE rules).
+#   needle: optional lowercase string contained in every match; files without any of their
+#           rules' needles are skipped without being scanned line by line.
+Rule = collections.namedtuple('Rule', 'glob kind regex replacement needle')
 
 TODO_RE = r'^\s*(//|\*)\s?TODO'
+TODO_PATTERN = re.compile(TODO_RE, flags=FLAGS)
+# Every line matched by TODO_RE contains this (case-insensitively), so files without it are skipped.
+TODO_NEEDLE = 'todo'
+
+RULES = (
+    Rule('*.cs', LINE, TODO_RE, None, TODO_NEEDLE),
+    Rule('ProjectSettings.asset', INLINE, r'^(\s*appleDeveloperTeamID:)[ \t]*\S+', r'\1 ',
+         'appledeveloperteamid'),
+    Rule('build-sample-apps.sh', INLINE, r'(XCODE_TEAM_ID:-)"[^"]+"', r'\1""', 'xcode_team_id'),
+)
+
+
+class CompiledRules(object):
+    """All the rules that apply to one file, folded into one line regex and one inline regex."""
+
+    def __init__(self, rules):
+        line_rules = [rule for rule in rules if rule.kind == LINE]
+        inline_rules = [rule for rule in rules if rule.kind == INLINE]
+        self.line_pattern = None
+        if line_rules:
+            self.line_pattern = re.compile(
+                '|'.join('(?:{})'.format(rule.regex) for rule in line_rules), flags=FLAGS)
+        self.inline_pattern = None
+        if inline_rules:
+            self.inline_pattern = re.compile(
+                '|'.join('(?P<r{}>{})'.format(i, rule.regex) for i, rule in enumerate(inline_rules)),
+                flags=FLAGS)
+        self.inline_rules = [(re.compile(rule.regex, flags=FLAGS), rule.replacement)
+                             for rule in inline_rules]
+        needles = [rule.needle for rule in rules]
+        self.needles = None if None in needles else tuple(set(needles))
+
+    def _replace(self, match):
+        # The outermost named group closes last, so lastgroup identifies the rule that matched.
+        regex, replacement = self.inline_rules[int(match.lastgroup[1:])]
+        return regex.match(match.string, match.start()).expand(replacement)
+
+    def apply(self, data):
+        """Returns (lines, changed) for the given file contents.
+
+        Lines are split on '\\n' only and kept byte-for-byte, so line endings and encodings are
+        preserved. changed counts removed plus rewritten lines.
+        """
+        lines = []
+        changed = 0
+        for line in io.BytesIO(data):
+            if self.line_pattern is not None and self.line_pattern.match(line):
+                changed += 1
+                continue
+            if self.inline_pattern is not None:
+                newline = self.inline_pattern.sub(self._replace, line)
+                if newline != line:
+                    changed += 1
+                    line = newline
+            lines.append(line)
+        return lines, changed
+
+
+_compiled_rules = {}
 
-def process_directory(path):
-    """Walk the path and run remove_todos on every file."""
+def compile_rules(rules):
+    """Returns the CompiledRules for a tuple of rules, compiling each distinct tuple only once."""
+    if rules not in _compiled_rules:
+        _compiled_rules[rules] = CompiledRules(rules)
+    return _compiled_rules[rules]
+
+def rules_for(filename, rules=RULES):
+    """Returns the tuple of rules whose glob matches the given file name."""
+    return tuple(rule for rule in rules if fnmatch.fnmatchcase(filename, rule.glob))
+
+def process_directory(path, processes=None, rules=RULES, dry_run=False, out=sys.stdout):
+    """Walk the path and apply the matching rules to every file, spread across a process pool.
+
+    Returns a dict mapping each changed file to the number of lines removed or rewritten in it.
+    Files with nothing to change are never rewritten. With dry_run, nothing is written to disk;
+    a unified diff of every change is streamed to out instead.
+    """
+    jobs = []
     for (dirpath, _unused, filenames) in os.walk(path):
         for filename in filenames:
-            if filename.endswith('.cs'):
-                process_file(dirpath, filename, TODO_RE)
+            file_rules = rules_for(filename, rules)
+            if file_rules:
+                jobs.append((dirpath + "/" + filename, file_rules, dry_run))
+
+    pool = None
+    if processes == 1 or len(jobs) < 2:
+        results = (_process_job(job) for job in jobs)
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap(_process_job, jobs, chunksize=max(1, len(jobs) / 64))
+    try:
+        report = {}
+        for (fname, changed, diff) in results:
+            if changed:
+                report[fname] = changed
+            if diff:
+                out.writelines(diff)
+        return report
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+def _process_job(job):
+    """Pool worker: returns (fname, changed line count, diff lines) for a single file."""
+    fname, file_rules, dry_run = job
+    changed, diff = rewrite_file(fname, compile_rules(file_rules), dry_run)
+    return fname, changed, diff
+
+def process_file(dirname, filename, regex, needle=None):
+    """Remove every line that matches regex. Returns the number of lines removed."""
+    if hasattr(regex, 'pattern'):
+        regex = _with_inline_flags(regex)
+    return strip_file(dirname + "/" + filename, regex, needle)
 
-def process_file(dirname, filename, regex):
-    """Remove every line that matches regex"""
-    readfile = dirname + "/" + filename
-    writefile = readfile + ".tmp"
-    with open(readfile, "r") as infile, open(writefile, "w") as outfile:
-        for line in infile:
-            if not re.match(regex, line, flags=re.UNICODE | re.IGNORECASE):
-                outfile.write(line)
+# Inline flag letters of the re flags a compiled pattern can carry
+INLINE_FLAGS = ((re.IGNORECASE, 'i'), (re.LOCALE, 'L'), (re.MULTILINE, 'm'), (re.DOTALL, 's'),
+                (re.UNICODE, 'u'), (re.VERBOSE, 'x'))
 
-    os.rename(writefile, readfile)
+def _with_inline_flags(regex):
+    """Returns the pattern of a compiled regex, with its flags spelled out as a leading (?...)."""
+    letters = ''.join(letter for flag, letter in INLINE_FLAGS if regex.flags & flag)
+    return '(?{}){}'.format(letters, regex.pattern) if letters else regex.pattern
+
+def strip_file(fname, regex, needle=None):
+    """Remove every line matching regex from fname, rewriting it only if needed."""
+    changed, _diff = rewrite_file(fname, compile_rules((Rule('*', LINE, regex, None, needle),)))
+    return changed
+
+def rewrite_file(fname, compiled, dry_run=False):
+    """Apply the compiled rules to fname. Returns (changed line count, unified diff lines).
+
+    The file is only rewritten if something changed, and never with dry_run; the diff is only
+    computed with dry_run.
+    """
+    with open(fname, 'rb') as infile:
+        data = infile.read()
+    if compiled.needles is not None:
+        lowered = data.lower()
+        if not any(needle in lowered for needle in compiled.needles):
+            return 0, None
+
+    lines, changed = compiled.apply(data)
+    if not changed:
+        return 0, None
+    if dry_run:
+        return changed, _unified_diff(io.BytesIO(data).readlines(), lines, fname)
+    writefile = fname + ".tmp"
+    with open(writefile, 'wb') as outfile:
+        outfile.writelines(lines)
+    # keeps the mode bits, like the exec bit of build-sample-apps.sh
+    shutil.copymode(fname, writefile)
+    os.rename(writefile, fname)
+    return changed, None
+
+def _unified_diff(old, new, fname):
+    """Returns the lines of a unified diff that patch can apply, marking a last line without newline."""
+    diff = []
+    for line in difflib.unified_diff(old, new, fname, fname):
+        diff.append(line)
+        if not line.endswith('\n'):
+            diff[-1] += '\n'
+            diff.append('\\ No newline at end of file\n')
+    return diff
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -33,9 +197,15 @@ if __name__ == "__main__":
     parser.add_argument('path',
                         help='The root of the file tree to remove all private lines from. Defaults to the current directory.',
                         default='.', nargs='?')
+    parser.add_argument('--dry-run',
+                        action='store_true',
+                        help='Print a unified diff of what would be removed instead of changing any files.',
+                        default=False)
     args = parser.parse_args()
-    # Verify before performing potentially destructive behavior
-    print 'This script will remove all private lines found in: {}\n'.format(args.path)
-    raw_input('Press Enter to continue...\n')
-    process_directory(args.path)
-
+    if not args.dry_run:
+        # Verify before performing potentially destructive behavior
+        print 'This script will remove all private lines found in: {}\n'.format(args.path)
+        raw_input('Press Enter to continue...\n')
+    report = process_directory(args.path, dry_run=args.dry_run)
+    for fname in sorted(report):
+        print >> sys.stderr, '{}: {} line(s)'.format(fname, report[fname])
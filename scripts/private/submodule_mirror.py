@@ -0,0 +1,145 @@
+#! /usr/bin/python2.7
+"""Updates the SDK submodules from local bare mirrors of their remotes.
+
+Every remote gets one bare mirror under MIRROR_DIR (set MOPUB_GIT_MIRRORS to move it), shared by
+every checkout and workspace on the machine. Submodule checkouts borrow the mirror's objects
+through objects/info/alternates, so after the mirror's fetch, which only brings what is new,
+updating a checkout copies nothing. All the submodules are fetched at the same time.
+
+The mirrors never prune unreachable objects, since the checkouts may rely on any of them.
+
+Without mirrors, the submodules can instead be fetched straight from their remotes, shallow
+(depth) or without blobs (filter). Neither kind of history can be merged into, so the submodule
+is moved to the fetched commit rather than merged with it.
+
+    submodule_mirror.py [--checkout] [--no-mirror [--depth N] [--filter SPEC]] SUBMODULE...
+"""
+import argparse, hashlib, os, re, subprocess, sys
+import git_helper, os_helper, scheduler
+
+MIRROR_DIR = os.environ.get('MOPUB_GIT_MIRRORS', os.path.join(
+    os.path.expanduser('~'), '.cache', 'mopub-unity', 'mirrors'))
+
+
+def mirror_path(url, mirror_dir=MIRROR_DIR):
+    """Returns where the mirror of url lives: named for the repo, and a hash of the full url."""
+    name = re.sub(r'\.git$', '', url.rstrip('/').split('/')[-1].split(':')[-1])
+    return os.path.join(mirror_dir, '{}-{}.git'.format(name, hashlib.sha1(url).hexdigest()[:8]))
+
+def update_mirror(url, mirror_dir=MIRROR_DIR):
+    """Creates or fetches the bare mirror of url, returning its path."""
+    path = mirror_path(url, mirror_dir)
+    if os.path.isdir(path):
+        os_helper.check_call('git -C {} fetch --prune --quiet origin'.format(path))
+        return path
+    if not os.path.isdir(mirror_dir):
+        os.makedirs(mirror_dir)
+    # cloned beside its final name, so an interrupted clone is never mistaken for a mirror
+    tmpname = path + '.tmp'
+    if os.path.isdir(tmpname):
+        os_helper.check_call('rm -rf {}'.format(tmpname))
+    os_helper.check_call('git clone --mirror --quiet {} {}'.format(url, tmpname))
+    os_helper.check_call('git -C {} config gc.pruneExpire never'.format(tmpname))
+    os.rename(tmpname, path)
+    return path
+
+def borrow(repo_path, mirror):
+    """Lets the repository at repo_path use the objects of mirror, through its alternates file."""
+    objects = os.path.join(os.path.abspath(mirror), 'objects')
+    info = os.path.join(git_helper.Repo(repo_path, search_parents=False).common_dir, 'objects', 'info')
+    alternates = os.path.join(info, 'alternates')
+    existing = []
+    if os.path.isfile(alternates):
+        with open(alternates) as infile:
+            existing = infile.read().splitlines()
+    if objects not in existing:
+        if not os.path.isdir(info):
+            os.makedirs(info)
+        with open(alternates, 'a') as outfile:
+            outfile.write(objects + '\n')
+
+def is_initialized(submodule):
+    """Returns whether submodule is checked out, with a .git of its own."""
+    return os.path.exists(os.path.join(submodule, '.git'))
+
+def update(submodule, branch='master', mirror=True, depth=None, filter=None, checkout=False,
+           mirror_dir=MIRROR_DIR):
+    """Brings the submodule up to date with branch on its origin, like `git pull origin branch`.
+
+    With checkout, the local branch is checked out first. depth and filter only apply without mirror.
+    Raises a CalledProcessError if the submodule isn't initialized.
+    """
+    # never the superproject, which `git -C` would find above an uninitialized submodule
+    repo = git_helper.Repo(submodule, search_parents=False)
+    source = 'origin'
+    options = ''
+    if mirror:
+        source = update_mirror(repo.remote_url(), mirror_dir)
+        borrow(submodule, source)
+    else:
+        if depth:
+            options += ' --depth {}'.format(depth)
+        if filter:
+            options += ' --filter={}'.format(filter)
+    if checkout:
+        os_helper.check_call('git -C {} checkout {}'.format(submodule, branch))
+    os_helper.check_call('git -C {} fetch --quiet{} {} +refs/heads/{}:refs/remotes/origin/{}'.format(
+        submodule, options, source, branch, branch))
+    if options:
+        os_helper.check_call('git -C {} checkout --quiet {} origin/{}'.format(
+            submodule, '-B ' + branch if checkout else '--detach', branch))
+    else:
+        os_helper.check_call('git -C {} merge --no-edit origin/{}'.format(submodule, branch))
+
+def update_all(submodules, **kwargs):
+    """Updates the submodules concurrently, with update()'s keyword arguments."""
+    steps = scheduler.Scheduler()
+    for submodule in submodules:
+        steps.add('update ' + submodule, update, submodule, **kwargs)
+    steps.run()
+
+def recover(mirror_dir=MIRROR_DIR):
+    """Like `git submodule update --init --recursive`, cloning or updating from the mirrors."""
+    os_helper.check_call('git submodule init')
+    submodules = []
+    for line in os_helper.check_output(
+            "git config -f .gitmodules --get-regexp '^submodule\..*\.path$'").splitlines():
+        name = line.split()[0][len('submodule.'):-len('.path')]
+        url = os_helper.check_output('git config --get submodule.{}.url'.format(name)).strip()
+        submodules.append((line.split()[1], url))
+
+    steps = scheduler.Scheduler()
+    for path, url in submodules:
+        steps.add('mirror ' + path, update_mirror, url, mirror_dir)
+    mirrors = steps.run()
+    for path, url in submodules:
+        mirror = mirrors['mirror ' + path]
+        if os.path.exists(os.path.join(path, '.git')):
+            borrow(path, mirror)
+        # --reference only matters to submodules that still have to be cloned
+        os_helper.check_call('git submodule update --recursive --reference {} -- {}'.format(mirror, path))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Update SDK submodules from local mirrors.')
+    parser.add_argument('submodules', nargs='+')
+    parser.add_argument('--branch', default='master')
+    parser.add_argument('--checkout', action='store_true',
+                        help='Check out the branch before updating it.')
+    parser.add_argument('--no-mirror', dest='mirror', action='store_false',
+                        help='Fetch straight from the remotes, without a local mirror.')
+    parser.add_argument('--depth', type=int, help='Fetch shallow, with --no-mirror.')
+    parser.add_argument('--filter', help='Fetch partially, e.g. blob:none, with --no-mirror.')
+    args = parser.parse_args()
+    if (args.depth or args.filter) and args.mirror:
+        parser.error('--depth and --filter need --no-mirror')
+    submodules = []
+    for path in args.submodules:
+        if is_initialized(path):
+            submodules.append(path)
+        elif os.path.isdir(path):
+            print 'Skipping {}, which is not initialized (see `git submodule update --init`)'.format(path)
+    try:
+        update_all(submodules, branch=args.branch,
+                   mirror=args.mirror, depth=args.depth, filter=args.filter, checkout=args.checkout)
+    except subprocess.CalledProcessError as e:
+        sys.exit(e.returncode)
@@ -0,0 +1,198 @@
+#! /usr/bin/python2.7
+"""Runs the Unity editor in batch mode, watching its log file so failures are caught as they happen.
+
+Unity in batch mode writes everything to the file given with -logFile and can take minutes to get
+through startup and the asset import before it gives up on, say, a script that doesn't compile.
+The log is tailed while the editor runs, and as soon as a line matches one of the known failure
+SIGNATURES the editor (with everything it spawned) is killed and a CalledProcessError is raised
+with an excerpt of the log.
+
+Also usable in front of an editor command line, keeping its exit status:
+    unity_runner.py $UNITY_BIN -batchmode ... -logFile scripts/testlog.txt
+A stub UNITY_BIN that writes a scripted log is enough to exercise it, e.g. unity_stub.py.
+"""
+import collections, io, os, re, signal, subprocess, sys, time
+import profiler
+
+UNITY_BIN = os.environ.get('UNITY_BIN')
+PROJECT_PATH = 'unity-sample-app'
+TEST_LOG = os.path.join('scripts', 'testlog.txt')
+TEST_RESULTS = os.path.join('scripts', 'testresults.xml')
+POLL_INTERVAL = 0.2
+# Lines of log kept before a failure, and read after it, for the excerpt
+EXCERPT_BEFORE = 10
+EXCERPT_AFTER = 20
+# How long the editor gets to exit after SIGTERM before it is killed outright
+TERMINATE_GRACE = 5
+
+# (description, regex) of log lines that mean the run has failed, however long it keeps going.
+# Unity prints a -----CompilerOutput:-stderr block after every compile, so it's the failure flag in
+# the block's stdout header, or the compiler errors themselves, that mark a broken build.
+SIGNATURES = [(description, re.compile(pattern)) for description, pattern in [
+    ('Script compile errors', r'^-----CompilerOutput:-stdout.*compilationhadfailure: True'),
+    ('Script compile errors', r'\berror CS\d{4}:'),
+    ('Script compile errors', r'^Scripts have compiler errors'),
+    ('No Unity license', r'No valid Unity (Editor )?[Ll]icen[cs]e|LICENSE SYSTEM .*[Ee]rror|'
+                         r'Failed to (activate|update) (the )?licen[cs]e'),
+    ('Package import failed', r'^(Failed to import package|Error while importing package|'
+                              r"Couldn't decompress package)"),
+    ('Project already open', r'another Unity instance is running with this project open|'
+                             r'Multiple Unity instances cannot open the same project'),
+]]
+
+
+class LogTail(object):
+    """Returns the complete lines appended to a file since the last call.
+
+    The file may not exist yet, and is read again from the start if it is truncated or replaced.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.partial = ''
+
+    def read_lines(self, final=False):
+        """With final, a last line without a newline is returned too."""
+        if self.file is not None:
+            try:
+                stat = os.stat(self.path)
+            except OSError:
+                stat = None
+            current = os.fstat(self.file.fileno())
+            if stat is None or stat.st_ino != current.st_ino or stat.st_size < self.file.tell():
+                self.close()
+        if self.file is None:
+            if not os.path.isfile(self.path):
+                return []
+            # io rather than a file object, whose C stdio EOF flag can stick on later reads
+            self.file = io.open(self.path, 'rb')
+            self.partial = ''
+        data = self.partial + self.file.read()
+        lines = data.split('\n')
+        self.partial = lines.pop()
+        if final and self.partial:
+            lines.append(self.partial)
+            self.partial = ''
+        return lines
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def run(args, log_file=None, signatures=SIGNATURES, timeout=None):
+    """Runs the editor command line args, watching log_file (by default, the -logFile argument).
+
+    Returns the editor's exit status. Raises a CalledProcessError if a failure signature shows up in
+    the log, or the editor is still running after timeout seconds; the editor is killed first.
+    """
+    if log_file is None:
+        log_file = args[args.index('-logFile') + 1]
+    # a log left over from an earlier run would match straight away
+    if os.path.isfile(log_file):
+        os.remove(log_file)
+    start = time.time()
+    # its own process group, so the compilers and asset workers it starts can be killed with it
+    process = subprocess.Popen(args, env=os.environ, preexec_fn=os.setsid,
+                               stdout=open(os.devnull, 'wb'), stderr=subprocess.STDOUT)
+    tail = LogTail(log_file)
+    recent = collections.deque(maxlen=EXCERPT_BEFORE)
+    failure = None
+    returncode = None
+    following = []
+    try:
+        while failure is None:
+            returncode = _reap(process, args, start)
+            exited = returncode is not None
+            lines = tail.read_lines(final=exited)
+            for index, line in enumerate(lines):
+                recent.append(line)
+                failure = _match(line, signatures)
+                if failure:
+                    following = lines[index + 1:]
+                    break
+            if failure or exited:
+                break
+            if timeout is not None and time.time() - start > timeout:
+                failure = 'Timed out after {}s'.format(timeout)
+                break
+            time.sleep(POLL_INTERVAL)
+        if failure is not None:
+            # Unity writes each block of output at once, so whatever follows is usually there already
+            excerpt = list(recent) + (following + tail.read_lines(final=True))[:EXCERPT_AFTER]
+            if returncode is None:
+                returncode = _terminate(process, args, start)
+    finally:
+        tail.close()
+        if returncode is None:
+            returncode = _reap(process, args, start, block=True)
+
+    if failure is not None:
+        raise subprocess.CalledProcessError(
+            returncode or 1, ' '.join(args),
+            output='{} in {}:\n{}'.format(failure, log_file, '\n'.join(excerpt)))
+    return returncode
+
+def run_tests(project_path=PROJECT_PATH, results=TEST_RESULTS, log_file=TEST_LOG, timeout=None):
+    """Runs the project's editor tests, like scripts/run_unit_tests.sh. Returns Unity's exit status:
+    0 if the tests passed, 2 if some failed.
+    """
+    if os.path.isfile(results):
+        os.remove(results)
+    return run([unity_bin(), '-runEditorTests', '-projectPath', os.path.abspath(project_path),
+                '-editorTestsResultFile', os.path.abspath(results),
+                '-logFile', os.path.abspath(log_file), '-force-free', '-batchmode'],
+               timeout=timeout)
+
+
+def unity_bin():
+    """Returns UNITY_BIN, raising a CalledProcessError if it isn't set."""
+    if not UNITY_BIN:
+        raise subprocess.CalledProcessError(1, cmd="unity_runner",
+                                            output="UNITY_BIN environment variable is not defined!")
+    return UNITY_BIN
+
+def _match(line, signatures):
+    for description, regex in signatures:
+        if regex.search(line):
+            return description
+    return None
+
+def _terminate(process, args, start):
+    """Stops the editor's process group. Returns the editor's exit status, if it has been reaped."""
+    returncode = None
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        deadline = time.time() + TERMINATE_GRACE
+        while returncode is None and time.time() < deadline:
+            time.sleep(0.1)
+            returncode = _reap(process, args, start)
+        # anything it started that is still around
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        # the whole group has exited already
+        pass
+    return returncode
+
+def _reap(process, args, start, block=False):
+    """Reaps the editor with os.wait4, recording it in the profiler trace like os_helper does.
+
+    Returns its exit status, or None if it is still running and block is False.
+    """
+    pid, status, usage = os.wait4(process.pid, 0 if block else os.WNOHANG)
+    if pid == 0:
+        return None
+    process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    profiler.command(args, start, usage)
+    return process.returncode
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or '-logFile' not in sys.argv:
+        sys.exit('Usage: {} UNITY_BIN [unity arguments...] -logFile LOG'.format(sys.argv[0]))
+    try:
+        sys.exit(run(sys.argv[1:]))
+    except subprocess.CalledProcessError as e:
+        # stderr, since scripts calling this send the editor's stdout to /dev/null
+        print >> sys.stderr, '\033[0;31m{}\033[0m'.format(e.output)
+        sys.exit(1)
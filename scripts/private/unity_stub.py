@@ -0,0 +1,75 @@
+#! /usr/bin/python2.7
+"""A stand-in for the Unity editor, for trying out the release tooling on machines without Unity.
+
+Point UNITY_BIN at this script. It writes the scripted log in UNITY_STUB_LOG to the -logFile path a
+line at a time, then exits with UNITY_STUB_EXIT (0 by default). In the scripted log,
+    #sleep SECONDS   pauses before the next line
+    #exit STATUS     exits right away
+Any other line is written to the log as is. With -editorTestsResultFile, the file named by
+UNITY_STUB_RESULTS is copied there once the log has been written. With -executeMethod
+MoPubSampleBuild.PerformBuild, it writes a build named like MoPubSampleBuild.cs would, in the
+project's Build folder.
+
+Like Unity, it locks the -projectPath while it runs, and fails if another editor has it locked.
+"""
+import errno, fcntl, os, shutil, sys, time
+
+LOCKED_MESSAGE = 'Multiple Unity instances cannot open the same project.'
+
+
+def argument(args, name):
+    return args[args.index(name) + 1] if name in args else None
+
+def main(args):
+    log_path = argument(args, '-logFile')
+    project = argument(args, '-projectPath')
+    script = os.environ.get('UNITY_STUB_LOG')
+    lines = open(script).read().splitlines() if script else []
+    with open(log_path, 'w') if log_path else open(os.devnull, 'w') as log:
+        log.write('Stub Unity editor: {}\n'.format(' '.join(args)))
+        if project and not lock_project(project):
+            log.write(LOCKED_MESSAGE + '\n')
+            return 1
+        for line in lines:
+            if line.startswith('#sleep '):
+                time.sleep(float(line.split()[1]))
+            elif line.startswith('#exit '):
+                return int(line.split()[1])
+            else:
+                log.write(line + '\n')
+            log.flush()
+        if argument(args, '-executeMethod') == 'MoPubSampleBuild.PerformBuild':
+            write_build(project, argument(args, '-buildTarget'),
+                        [arg for arg in args if arg.startswith('lastCommit=')][0].split('=', 1)[1])
+    results = argument(args, '-editorTestsResultFile')
+    if results and os.environ.get('UNITY_STUB_RESULTS'):
+        shutil.copyfile(os.environ['UNITY_STUB_RESULTS'], results)
+    return int(os.environ.get('UNITY_STUB_EXIT', 0))
+
+def lock_project(project):
+    """Locks Temp/UnityLockfile until this process exits. Returns False if another editor has it."""
+    temp = os.path.join(project, 'Temp')
+    if not os.path.isdir(temp):
+        os.makedirs(temp)
+    # kept open on purpose: the lock goes with the process, however it ends
+    fd = os.open(os.path.join(temp, 'UnityLockfile'), os.O_CREAT | os.O_WRONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except IOError as e:
+        if e.errno not in (errno.EAGAIN, errno.EACCES):
+            raise
+        return False
+    return True
+
+def write_build(project, platform, last_commit):
+    build = os.path.join(project, 'Build', 'MoPubSampleUnity{}_stub+{}{}'.format(
+        platform, last_commit, '.apk' if platform == 'Android' else ''))
+    if not os.path.isdir(os.path.dirname(build)):
+        os.makedirs(os.path.dirname(build))
+    if platform == 'Android':
+        open(build, 'w').close()
+    elif not os.path.isdir(build):
+        os.mkdir(build)
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
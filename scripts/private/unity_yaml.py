@@ -0,0 +1,158 @@
+"""Reads and edits values in Unity's YAML asset files, like ProjectSettings.asset, by path.
+
+Unity writes a restricted YAML dialect: a %TAG !u! directive, then documents headed
+`--- !u!<class id> &<file id>`, each a single block mapping. Nested mappings are indented by two
+spaces, and sequence items start with '- ' at the same column as the key that holds them:
+
+    --- !u!129 &1
+    PlayerSettings:
+      buildNumber:
+        iOS: 0
+      m_BuildTargetIcons:
+      - m_BuildTarget: iPhone
+
+The file is read in one pass, recording where every value is under a dotted path like
+PlayerSettings.buildNumber.iOS or PlayerSettings.m_BuildTargetIcons.0.m_BuildTarget (sequence items
+are numbered). Values are then read and replaced through that index, leaving every other byte of
+the file as it was, and written back with a single write. Only plain scalars are supported.
+"""
+import collections, os, re, shutil, subprocess
+
+# indent, the '- ' of a sequence item, key, and the ': ' before its value
+LINE_RE = re.compile(r'^( *)(- +)?(?:([^\s:][^:]*?):(?: |$))?')
+
+# line: index of the key's line; value: offset of its value in that line;
+# end: index of the line after the value (more than line + 1 for a value wrapped over several lines)
+_Node = collections.namedtuple('_Node', 'line value end')
+
+
+class UnityYaml(object):
+    """A Unity YAML file, indexed by path. Edits are kept in memory until save()."""
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as infile:
+            self.lines = infile.read().splitlines(True)
+        self.index = collections.OrderedDict()
+        self.children = collections.defaultdict(list)
+        self.changed = False
+        self._parse()
+
+    def __contains__(self, path):
+        return path in self.index
+
+    def get(self, path):
+        """Returns the value at path as written, e.g. '5.10.0', or '' for an empty value."""
+        node = self._node(path)
+        text = ''.join(self.lines[node.line:node.end])
+        return ' '.join(line.strip() for line in text[node.value:].splitlines())
+
+    def set(self, path, value):
+        """Replaces the value at path, which must be a scalar, with the plain scalar value."""
+        node = self._node(path)
+        if self.children[path]:
+            raise subprocess.CalledProcessError(1, cmd="UnityYaml.set",
+                                                output="{} in {} is not a scalar".format(path, self.path))
+        line, last_line = self.lines[node.line], self.lines[node.end - 1]
+        newline = last_line[len(last_line.rstrip('\r\n')):]
+        # Unity always writes the space after the colon, even before an empty value
+        replacement = line[:node.value].rstrip(' ') + ' ' + str(value) + newline
+        if self.lines[node.line:node.end] != [replacement]:
+            self.lines[node.line:node.end] = [replacement]
+            self.changed = True
+            if node.end - node.line != 1:
+                # lines have moved, so index them again
+                self._parse()
+            else:
+                self.index[path] = _Node(node.line, len(line[:node.value].rstrip(' ')) + 1, node.line + 1)
+
+    def keys(self, path):
+        """Returns the keys directly under the mapping or sequence at path, in file order."""
+        self._node(path)
+        return list(self.children[path])
+
+    def save(self):
+        """Writes the file, if anything changed, through a temp file renamed into place."""
+        if not self.changed:
+            return
+        tmpname = self.path + '.tmp'
+        with open(tmpname, 'wb') as outfile:
+            outfile.writelines(self.lines)
+        shutil.copymode(self.path, tmpname)
+        os.rename(tmpname, self.path)
+        self.changed = False
+
+    def _node(self, path):
+        node = self.index.get(path)
+        if node is None:
+            raise subprocess.CalledProcessError(1, cmd="UnityYaml",
+                                                output="No {} in {}".format(path, self.path))
+        return node
+
+    def _parse(self):
+        self.index.clear()
+        self.children.clear()
+        # (column, path, is_sequence, item count) of the enclosing mappings and sequences
+        stack = []
+        # the last key with an empty value, which may turn out to hold a mapping or sequence
+        pending = None
+        last = None
+        for number, line in enumerate(self.lines):
+            content = line.rstrip('\r\n')
+            if content.startswith('--- ') or content.startswith('%') or not content.strip():
+                if content.startswith('--- '):
+                    stack, pending, last = [(0, '', False, 0)], None, None
+                continue
+            if not stack:
+                stack = [(0, '', False, 0)]
+            match = LINE_RE.match(content)
+            column = len(match.group(1))
+            dash, key = match.group(2), match.group(3)
+
+            if dash:
+                while stack and stack[-1][0] > column:
+                    stack.pop()
+                if not (stack[-1][2] and stack[-1][0] == column):
+                    if pending is None or pending[0] > column:
+                        last = self._continue(last, number)
+                        continue
+                    stack.append((column, pending[1], True, 0))
+                    pending = None
+                _column, parent, _sequence, count = stack.pop()
+                stack.append((column, parent, True, count + 1))
+                item = '{}.{}'.format(parent, count) if parent else str(count)
+                self._add(parent, item, _Node(number, column + len(dash), number + 1))
+                last = item
+                if key is None:
+                    continue
+                # the item is a mapping, whose first key is on the same line as the dash
+                column += len(dash)
+                stack.append((column, item, False, 0))
+            elif key is None:
+                last = self._continue(last, number)
+                continue
+
+            while stack[-1][0] > column or (stack[-1][0] == column and stack[-1][2]):
+                stack.pop()
+            if stack[-1][0] < column:
+                if pending is None or pending[0] >= column:
+                    last = self._continue(last, number)
+                    continue
+                stack.append((column, pending[1], False, 0))
+            parent = stack[-1][1]
+            path = parent + '.' + key if parent else key
+            self._add(parent, path, _Node(number, match.end(), number + 1))
+            last = path
+            pending = (column, path) if not content[match.end():].strip() else None
+
+    def _add(self, parent, path, node):
+        # Unity never repeats a key; for files that do, the first one wins
+        if path not in self.index:
+            self.index[path] = node
+            self.children[parent].append(path[len(parent) + 1:] if parent else path)
+
+    def _continue(self, last, number):
+        """Extends the last value over a line that isn't a key: a wrapped scalar."""
+        if last is not None:
+            node = self.index[last]
+            self.index[last] = node._replace(end=number + 1)
+        return last
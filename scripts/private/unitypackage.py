@@ -0,0 +1,228 @@
+#! /usr/bin/python2.7
+"""Writes MoPubUnity.unitypackage straight from the sample app's files, without launching Unity.
+
+A .unitypackage is a gzipped tar with one directory per asset, named for the GUID in its .meta file:
+    <guid>/asset        the file itself (omitted for folders)
+    <guid>/asset.meta   its .meta file
+    <guid>/pathname     its path relative to the project, e.g. Assets/MoPub/Scripts/MoPub.cs
+
+The package holds the same folders scripts/unity-export-package.sh passes to Unity's -exportPackage:
+every folder directly under Assets/MoPub except Mediation, plus Assets/PlayServicesResolver. The
+Android res* folders are left out, so the package doesn't override the publisher's app icon.
+Entries are sorted and stamped with a fixed mtime and owner, so the same files always produce
+the same bytes.
+
+Each asset's tar members are compressed as a separate gzip member; a gzip file may hold any number
+of members back to back, and tar headers don't depend on their position in the archive. The
+compressed members are cached by a hash of the asset's contents, so a rebuild only recompresses
+the assets that changed and copies the rest. Set MOPUB_PACKAGE_CACHE to change where the cache lives.
+"""
+import argparse, gzip, hashlib, io, json, os, re, shutil, stat, tarfile
+
+PROJECT_PATH = 'unity-sample-app'
+DEST_PACKAGE = os.path.join('mopub-unity-plugin', 'MoPubUnity.unitypackage')
+EXPORT_PARENT = 'Assets/MoPub'
+EXPORT_EXTRA_FOLDERS = ['Assets/PlayServicesResolver']
+EXCLUDED_FOLDERS = ['Mediation']
+# TODO (ADF-4383): Drop this once in-editor adaptive icons replace the res/ dir.
+EXCLUDED_PATHS_RE = re.compile(r'^Assets/MoPub/Plugins/Android/MoPub\.plugin/res')
+GUID_RE = re.compile(r'^guid:\s*([0-9a-f]{32})\s*$', re.MULTILINE)
+MTIME = 0
+BLOCKSIZE = tarfile.BLOCKSIZE
+# Already compressed assets get the fastest compression level, since the best one gains nothing.
+COMPRESSED_EXTENSIONS = ('.aar', '.jar', '.png', '.zip')
+CACHE_DIR = os.environ.get('MOPUB_PACKAGE_CACHE', os.path.join(
+    os.path.expanduser('~'), '.cache', 'mopub-unity', 'unitypackage'))
+
+
+def export_folders(project_path=PROJECT_PATH):
+    """Returns the project-relative folders to export, like `find Assets/MoPub/* -type d -prune`."""
+    parent = os.path.join(project_path, EXPORT_PARENT)
+    folders = [EXPORT_PARENT + '/' + name for name in sorted(os.listdir(parent))
+               if os.path.isdir(os.path.join(parent, name)) and name not in EXCLUDED_FOLDERS]
+    return folders + [folder for folder in EXPORT_EXTRA_FOLDERS
+                      if os.path.isdir(os.path.join(project_path, folder))]
+
+def collect_assets(project_path=PROJECT_PATH, folders=None):
+    """Returns a list of (guid, pathname) for every asset in the exported folders, sorted by guid.
+
+    Files Unity ignores (hidden ones, and those ending in ~) and assets without a .meta are skipped.
+    """
+    assets = {}
+    for folder in folders or export_folders(project_path):
+        for pathname in _walk(project_path, folder):
+            if EXCLUDED_PATHS_RE.match(pathname):
+                continue
+            meta = os.path.join(project_path, pathname + '.meta')
+            if not os.path.isfile(meta):
+                print 'Skipping {}, which has no .meta file'.format(pathname)
+                continue
+            guid = read_guid(meta)
+            if guid in assets:
+                raise ValueError('{} and {} have the same GUID {}'.format(assets[guid], pathname, guid))
+            assets[guid] = pathname
+    return sorted(assets.items())
+
+def read_guid(meta):
+    with open(meta, 'rb') as infile:
+        match = GUID_RE.search(infile.read())
+    if match is None:
+        raise ValueError('No GUID found in {}'.format(meta))
+    return match.group(1)
+
+def write_package(dest=DEST_PACKAGE, project_path=PROJECT_PATH, assets=None, cache_dir=CACHE_DIR):
+    """Writes the package for the given (or collected) assets into dest.
+
+    Returns (asset count, number of assets that had to be compressed).
+    """
+    if assets is None:
+        assets = collect_assets(project_path)
+    cache = _ChunkCache(cache_dir)
+    compressed = 0
+    tmpname = dest + '.tmp'
+    with open(tmpname, 'wb') as outfile:
+        _write_chunk(outfile, lambda tar: _add_member(tar, _tarinfo('.', tarfile.DIRTYPE)))
+        for guid, pathname in assets:
+            chunk, hit = cache.chunk(project_path, guid, pathname)
+            compressed += not hit
+            with open(chunk, 'rb') as infile:
+                shutil.copyfileobj(infile, outfile, 1 << 20)
+        # the end-of-archive marker is two empty blocks
+        _write_chunk(outfile, lambda tar: tar.write('\0' * BLOCKSIZE * 2))
+    os.rename(tmpname, dest)
+    cache.save()
+    return len(assets), compressed
+
+def add_asset(tar, project_path, guid, pathname):
+    """Writes the tar members of one asset to the uncompressed stream tar."""
+    path = os.path.join(project_path, pathname)
+    _add_member(tar, _tarinfo(guid, tarfile.DIRTYPE))
+    if not os.path.isdir(path):
+        _add_file(tar, guid + '/asset', path)
+    _add_file(tar, guid + '/asset.meta', path + '.meta')
+    info = _tarinfo(guid + '/pathname')
+    info.size = len(pathname)
+    _add_member(tar, info, io.BytesIO(pathname))
+
+
+class _ChunkCache(object):
+    """The compressed tar members of each asset, keyed on a hash of everything that goes into them.
+
+    An index of each asset's file stats lets unchanged assets skip even being hashed. Chunks not
+    used by the latest package are removed when the index is saved.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.index = {}
+        if os.path.isfile(self.index_path):
+            with open(self.index_path) as infile:
+                self.index = json.load(infile)
+        self.used = {}
+        if not os.path.isdir(os.path.join(cache_dir, 'chunks')):
+            os.makedirs(os.path.join(cache_dir, 'chunks'))
+
+    def chunk(self, project_path, guid, pathname):
+        """Returns (path of the asset's compressed chunk, whether it was already cached)."""
+        path = os.path.join(project_path, pathname)
+        stamp = [pathname, _stamp(path), _stamp(path + '.meta')]
+        entry = self.index.get(guid)
+        if entry is not None and entry['stamp'] == stamp:
+            key = entry['key']
+        else:
+            key = _asset_key(path, guid, pathname)
+        self.used[guid] = {'stamp': stamp, 'key': key}
+        chunk = os.path.join(self.cache_dir, 'chunks', key + '.gz')
+        if os.path.isfile(chunk):
+            return chunk, True
+        level = 1 if pathname.lower().endswith(COMPRESSED_EXTENSIONS) else 9
+        with open(chunk + '.tmp', 'wb') as outfile:
+            _write_chunk(outfile, lambda tar: add_asset(tar, project_path, guid, pathname), level)
+        os.rename(chunk + '.tmp', chunk)
+        return chunk, False
+
+    def save(self):
+        with open(self.index_path + '.tmp', 'w') as outfile:
+            json.dump(self.used, outfile, indent=1, sort_keys=True)
+        os.rename(self.index_path + '.tmp', self.index_path)
+        keys = set(entry['key'] + '.gz' for entry in self.used.values())
+        chunks_dir = os.path.join(self.cache_dir, 'chunks')
+        for name in os.listdir(chunks_dir):
+            if name not in keys:
+                os.remove(os.path.join(chunks_dir, name))
+
+
+def _asset_key(path, guid, pathname):
+    digest = hashlib.sha1()
+    digest.update('{}\n{}\n'.format(guid, pathname))
+    for part in ([path, path + '.meta'] if not os.path.isdir(path) else [path + '.meta']):
+        digest.update('{} {}\n'.format(os.path.basename(part), _mode(part)))
+        with open(part, 'rb') as infile:
+            for block in iter(lambda: infile.read(1 << 20), ''):
+                digest.update(block)
+    return digest.hexdigest()
+
+def _stamp(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime, stat.st_ino, stat.st_mode]
+
+def _write_chunk(outfile, write, level=9):
+    """Appends one gzip member to outfile, holding whatever write(stream) writes to stream."""
+    # filename='' keeps the output file name out of the gzip header
+    gz = gzip.GzipFile(filename='', mode='wb', fileobj=outfile, mtime=MTIME, compresslevel=level)
+    try:
+        write(gz)
+    finally:
+        gz.close()
+
+def _walk(project_path, folder):
+    """Yields folder and every asset under it, as project-relative paths with forward slashes."""
+    yield folder
+    for (dirpath, dirnames, filenames) in os.walk(os.path.join(project_path, folder)):
+        dirnames[:] = sorted(name for name in dirnames if is_asset(name))
+        relative = os.path.relpath(dirpath, project_path).replace(os.sep, '/')
+        for name in dirnames + sorted(filenames):
+            if is_asset(name) and not name.endswith('.meta'):
+                yield relative + '/' + name
+
+def is_asset(name):
+    """Whether Unity imports a file or folder by this name; it ignores hidden ones and those ending in ~."""
+    return not name.startswith('.') and not name.endswith('~')
+
+def _tarinfo(name, type=tarfile.REGTYPE):
+    info = tarfile.TarInfo('./' + name if name != '.' else './')
+    info.type = type
+    info.mtime = MTIME
+    info.mode = 0755 if type == tarfile.DIRTYPE else 0644
+    info.uid = info.gid = 0
+    info.uname = info.gname = ''
+    return info
+
+def _mode(path):
+    return 0755 if os.stat(path).st_mode & stat.S_IXUSR else 0644
+
+def _add_file(tar, name, path):
+    info = _tarinfo(name)
+    info.mode = _mode(path)
+    info.size = os.path.getsize(path)
+    with open(path, 'rb') as infile:
+        _add_member(tar, info, infile)
+
+def _add_member(tar, info, fileobj=None):
+    """Writes a tar header and its data, padded to a whole block, like TarFile.addfile."""
+    tar.write(info.tobuf(tarfile.GNU_FORMAT))
+    if fileobj is not None:
+        shutil.copyfileobj(fileobj, tar, 1 << 20)
+        remainder = info.size % BLOCKSIZE
+        if remainder:
+            tar.write('\0' * (BLOCKSIZE - remainder))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export MoPubUnity.unitypackage without Unity.')
+    parser.add_argument('--project', default=PROJECT_PATH,
+                        help='The Unity project to export from. Defaults to {}.'.format(PROJECT_PATH))
+    parser.add_argument('--output', default=DEST_PACKAGE,
+                        help='The package to write. Defaults to {}.'.format(DEST_PACKAGE))
+    args = parser.parse_args()
+    count, compressed = write_package(args.output, args.project)
+    print 'Exported {} assets ({} recompressed) to {}'.format(count, compressed, args.output)
@@ -27,12 +27,31 @@ function tests_failed {
   print_blue_line "Please see $TEST_RESULTS for full test results."
 }
 
+# Prints totals, the slowest tests and any that got slower, when the private scripts are around
+function tests_report {
+  if [ -f "$my_dir/private/nunit_report.py" ] && [ -f $TEST_RESULTS ]; then
+    print_blue_line "Test report: "
+    python2.7 "$my_dir/private/nunit_report.py" $TEST_RESULTS
+  fi
+}
+
+# Don't let a stale result file be mistaken for this run's
+rm -f $TEST_RESULTS
+
+# Watch the log as Unity runs, to stop it as soon as a script fails to compile
+UNITY_RUN=$UNITY_BIN
+if [ -f "$my_dir/private/unity_runner.py" ]; then
+  UNITY_RUN="python2.7 $my_dir/private/unity_runner.py $UNITY_BIN"
+fi
+
 echo "Running unit tests with Unity Editor at:"
 print_blue_line $UNITY_BIN
-$UNITY_BIN -runEditorTests -projectPath $PROJECT_PATH -editorTestsResultFile $TEST_RESULTS -logFile $TEST_LOG -force-free -batchmode > /dev/null 2>&1 /dev/null
+$UNITY_RUN -runEditorTests -projectPath $PROJECT_PATH -editorTestsResultFile $TEST_RESULTS -logFile $TEST_LOG -force-free -batchmode > /dev/null
+test_result=$?
 
-case $? in
-  0 ) tests_passed;;
+case $test_result in
+  0 ) tests_report; tests_passed;;
   1 ) tests_error;;
-  2 ) tests_failed;;
+  2 ) tests_report; tests_failed;;
 esac
+exit $test_result
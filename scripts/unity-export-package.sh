@@ -25,9 +25,15 @@ echo -e "Excluding Android resources to avoid overriding Publisher icon...\n"
 mv unity-sample-app/Assets/MoPub/Plugins/Android/MoPub.plugin/res* unity-sample-app/
 validate
 
-$UNITY_BIN -gvh_disable -projectPath $PROJECT_PATH -force-free -quit -batchmode -logFile $EXPORT_LOG \
+# Watch the log as Unity runs, to stop it as soon as a script fails to compile
+UNITY_RUN=$UNITY_BIN
+if [ -f "$my_dir/private/unity_runner.py" ]; then
+  UNITY_RUN="python2.7 $my_dir/private/unity_runner.py $UNITY_BIN"
+fi
+
+$UNITY_RUN -gvh_disable -projectPath $PROJECT_PATH -force-free -quit -batchmode -logFile $EXPORT_LOG \
            -importPackage $PROJECT_PATH/play-services-resolver-*.unitypackage \
-           -exportPackage $EXPORT_FOLDERS_MAIN $DEST_PACKAGE >& /dev/null
+           -exportPackage $EXPORT_FOLDERS_MAIN $DEST_PACKAGE > /dev/null
 validate_without_exit "Building the unity package has failed, please check $EXPORT_LOG\nMake sure Unity isn't running when invoking this script!"
 
 echo -e "Cleaning any changes to PlayServicesResolver...\n"
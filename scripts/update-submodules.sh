@@ -4,6 +4,12 @@ source "$my_dir/validate.sh"
 
 PROJECTS=( "mopub-android-sdk" "mopub-ios-sdk" "mopub-android" "mopub-ios" )
 
+# With the private scripts, update them all at once from local mirrors; options are passed along
+if [ -f "$my_dir/private/submodule_mirror.py" ]; then
+  python2.7 "$my_dir/private/submodule_mirror.py" --checkout "$@" "${PROJECTS[@]}"
+  exit $?
+fi
+
 for PROJECT in "${PROJECTS[@]}"
 do
   if [ -d "$PROJECT" ]; then